@@ -0,0 +1,143 @@
+"""
+Bulk import/export of the lore archive as JSONL.
+
+Usage (from the chatbot directory):
+    python archive.py export lore.jsonl.gz
+    python archive.py export - --kinds story > stories.jsonl
+    python archive.py import lore.jsonl.gz --chunk-size 2000
+    python archive.py import lore.jsonl.gz --writer-socket lore-writer.sock  # while launcher.py runs
+
+Each line is one JSON object with a "type" of user, alias, information or
+story plus that record's columns. Exports stream from a database cursor and
+imports are written in chunked transactions, so archives of any size move in
+constant memory. Files ending in .gz are (de)compressed on the fly; "-" means
+stdin/stdout.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import sys
+import time
+import aiohttp
+import database
+from writer import WriterClient
+
+logger = logging.getLogger('LoreBot.Archive')
+
+DEFAULT_CHUNK_SIZE = 1000
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+PROGRESS_EVERY = 10  # Log progress every N chunks
+
+def open_archive(path: str, mode: str):
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+async def download(url: str, path: str):
+    """Stream `url` (e.g. a Discord attachment) to the file `path` in fixed-size chunks."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as out:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+                    out.write(chunk)
+
+async def export_jsonl(out, kinds=database.ARCHIVE_KINDS):
+    """Write the chosen record kinds to the text stream `out`. Returns counts per kind."""
+    counts = {}
+    for kind in kinds:
+        count = 0
+        async for record in database.iter_records(kind):
+            record['type'] = kind
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+        counts[kind] = count
+        logger.info(f"Exported {count} {kind} records.")
+    return counts
+
+async def import_jsonl(lines, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Import archive lines from any iterable of strings. Consecutive records of the
+    same kind are written in chunks of `chunk_size`, one transaction per chunk.
+    Returns (records read, rows written).
+    """
+    started = time.monotonic()
+    read = written = chunks = 0
+    chunk, chunk_kind = [], None
+
+    async def flush():
+        nonlocal written, chunks, chunk
+        if not chunk:
+            return
+        written += await database.import_records(chunk_kind, chunk)
+        chunks += 1
+        chunk = []
+        if chunks % PROGRESS_EVERY == 0:
+            rate = read / max(time.monotonic() - started, 1e-9)
+            logger.info(f"Imported {read} records ({written} written, {rate:.0f} records/s)")
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.pop('type')
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Line {line_number}: not an archive record ({e})") from None
+        if kind not in database.ARCHIVE_KINDS:
+            raise ValueError(f"Line {line_number}: unknown record type '{kind}'")
+        if kind != chunk_kind or len(chunk) >= chunk_size:
+            await flush()
+            chunk_kind = kind
+        chunk.append(record)
+        read += 1
+    await flush()
+
+    logger.info(f"Import finished: {read} records read, {written} rows written in {time.monotonic() - started:.1f}s.")
+    return read, written
+
+async def main(args):
+    if args.db:
+        database.DB_NAME = args.db
+    if args.writer_socket:
+        # Write through a running writer service, so the bot's caches are invalidated too
+        writer = WriterClient(args.writer_socket, timeout=300)
+        await writer.connect()
+        await database.init_db(writer=writer)
+    else:
+        await database.init_db()
+    try:
+        if args.command == 'export':
+            kinds = args.kinds.split(',') if args.kinds else database.ARCHIVE_KINDS
+            out = open_archive(args.path, 'w')
+            try:
+                await export_jsonl(out, kinds)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        else:
+            source = open_archive(args.path, 'r')
+            try:
+                await import_jsonl(source, args.chunk_size)
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+    finally:
+        await database.close_db()
+
+if __name__ == '__main__':
+    # Log to stderr so exports to stdout stay clean
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('path', help='JSONL file (.gz for gzip, - for stdin/stdout)')
+    parser.add_argument('--db', help=f'database file (default: {database.DB_NAME})')
+    parser.add_argument('--kinds', help='export only these comma-separated kinds: ' + ','.join(database.ARCHIVE_KINDS))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='records per import transaction')
+    parser.add_argument('--writer-socket', help='send imports to the writer service on this socket (see launcher.py)')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,386 @@
+"""
+Offline end-to-end benchmark for the mention pipeline.
+
+Usage (from the chatbot directory):
+    python benchmarks/bench_pipeline.py --mentions 200 --concurrency 8 --output results.json
+    python benchmarks/bench_pipeline.py --compare results.json
+
+Drives bot.on_message and the slash command handlers with fake discord.py
+objects against a throwaway lore.db and a local stub of the Groq
+(OpenAI-compatible) endpoint with configurable latency. Reports p50/p95/p99
+latency per stage and messages/sec, and can save results as JSON so runs on
+different commits can be compared.
+
+Stages overlap: with --stream the llm stage includes the progressive message
+edits, which are also counted under discord.
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+CHATBOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, CHATBOT_DIR)
+
+from facts import clean_fact, fact_hash
+
+WORDS = ('taskforce', 'temple', 'guard', 'coruscant', 'naboo', 'kashyyyk', 'saber', 'council', 'master',
+         'padawan', 'clone', 'droid', 'sith', 'holocron', 'archive', 'battle', 'outpost', 'fleet', 'crystal',
+         'engineer', 'general', 'scripture', 'revolt', 'mission', 'hangar', 'shuttle', 'forest', 'desert')
+HOMEWORLDS = ('Coruscant', 'Naboo', 'Kashyyyk', 'Dantooine', 'Tatooine', None)
+
+BOT_ID = 999
+_stages = contextvars.ContextVar('stages', default=None)
+
+# --- STUB GROQ SERVER ---
+
+def stub_reply(rng):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))).capitalize() + '.'
+    if rng.random() < 0.3:
+        text += f" [[MEMORY: {rng.choice(['Preference', 'Identity', 'Event'])} | Mentioned the {rng.choice(WORDS)}]]"
+    return text
+
+async def start_stub_server(args, rng):
+    async def completions(request):
+        body = await request.json()
+        await asyncio.sleep(args.llm_latency / 1000)
+        text = stub_reply(rng)
+        usage = {'prompt_tokens': sum(len(m['content']) for m in body['messages']) // 4,
+                 'completion_tokens': len(text) // 4}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        if not body.get('stream'):
+            return web.json_response({
+                'id': 'bench', 'object': 'chat.completion', 'created': 0, 'model': body['model'], 'usage': usage,
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}],
+            })
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        for piece in pieces:
+            chunk = {'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'],
+                     'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(args.token_interval / 1000)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post('/openai/v1/chat/completions', completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+# --- FAKE DISCORD OBJECTS ---
+
+class FakeUser:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.display_name = name
+        self.name = name
+
+    def __str__(self):
+        return self.display_name
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeChannel:
+    def __init__(self, channel_id, rest_latency):
+        self.id = channel_id
+        self.rest_latency = rest_latency
+        self.messages = []  # oldest first
+
+    async def history(self, limit=100):
+        await discord_call(self.rest_latency)
+        for message in list(reversed(self.messages))[:limit]:
+            yield message
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, content):
+        await discord_call(self.rest_latency)
+        return FakeMessage(self, BOT_USER, content)
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, channel, author, content, mentions=()):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = list(mentions)
+
+    async def reply(self, content):
+        await discord_call(self.channel.rest_latency)
+        return FakeMessage(self.channel, BOT_USER, content)
+
+    async def edit(self, content=None):
+        await discord_call(self.channel.rest_latency)
+        self.content = content
+
+    async def delete(self):
+        await discord_call(self.channel.rest_latency)
+
+class FakeResponse:
+    def __init__(self, rest_latency):
+        self.rest_latency = rest_latency
+
+    async def defer(self, **kwargs):
+        await discord_call(self.rest_latency)
+
+    async def send_message(self, content=None, **kwargs):
+        await discord_call(self.rest_latency)
+
+class FakeFollowup:
+    def __init__(self, rest_latency):
+        self.rest_latency = rest_latency
+
+    async def send(self, content=None, **kwargs):
+        await discord_call(self.rest_latency)
+
+class FakeInteraction:
+    def __init__(self, user, rest_latency):
+        self.user = user
+        self.response = FakeResponse(rest_latency)
+        self.followup = FakeFollowup(rest_latency)
+
+BOT_USER = FakeUser(BOT_ID, 'Echo')
+
+async def discord_call(latency_ms):
+    start = time.perf_counter()
+    await asyncio.sleep(latency_ms / 1000)
+    record_stage('discord', time.perf_counter() - start)
+
+# --- STAGE TIMING ---
+
+def record_stage(stage, seconds):
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+def timed(stage, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            record_stage(stage, time.perf_counter() - start)
+    return wrapper
+
+def timed_sync(stage, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_stage(stage, time.perf_counter() - start)
+    return wrapper
+
+def instrument(bot, database):
+    """Wrap the pipeline's collaborators so each mention records time per stage."""
+    for name in ('get_user_profile', 'search_stories', 'get_recent_stories'):
+        setattr(database, name, timed('db_read', getattr(database, name)))
+    # store_memories writes every tag of a reply with one add_information_bulk call
+    database.add_information_bulk = timed('db_write', database.add_information_bulk)
+    bot.llm.complete = timed('llm', bot.llm.complete)
+    bot.llm.stream = timed('llm', bot.llm.stream)
+    bot.name_resolver.resolve_first = timed_sync('resolve', bot.name_resolver.resolve_first)
+    bot.prompt_assembler.build = timed_sync('prompt', bot.prompt_assembler.build)
+
+# --- SEEDING ---
+
+async def seed(database, args, rng):
+    users = [(i + 1, f"{rng.choice(WORDS).capitalize()}{i}") for i in range(args.users)]
+    await database.upsert_users(users)
+    async with database._write() as db:
+        await db.executemany('INSERT INTO user_aliases (user_id, alias) VALUES (?, ?)',
+                             [(rng.randint(1, args.users), f"{rng.choice(WORDS)}{i}") for i in range(args.aliases)])
+        facts = [(rng.randint(1, args.users), rng.choice(['Identity', 'Homeworld', 'Preference', 'Event']),
+                  ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))) for _ in range(args.info)]
+        # Same normalisation and content_hash as add_information_bulk, so seeded facts are deduplicated too
+        await db.executemany('''
+            INSERT INTO information (user_id, category, content, content_hash) VALUES (?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+        ''', [(user_id, category, clean_fact(content), fact_hash(content)) for user_id, category, content in facts])
+        await db.executemany('INSERT INTO stories (title, content, homeworld) VALUES (?, ?, ?)',
+                             [(f"The {rng.choice(WORDS)} of {rng.choice(WORDS)} {i}",
+                               ' '.join(rng.choice(WORDS) for _ in range(rng.randint(50, 400))),
+                               rng.choice(HOMEWORLDS)) for i in range(args.stories)])
+    return [name for _, name in users]
+
+# --- RUN ---
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99),
+            'mean_ms': sum(ordered) / len(ordered) * 1000}
+
+async def run_mentions(bot, args, rng, channels, names):
+    samples = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        channel = channels[i % len(channels)]
+        author = FakeUser(10_000_000 + rng.randint(0, args.senders), f"Sender{i % args.senders}")
+        # Background chatter between mentions exercises the registry and history paths
+        for _ in range(args.chatter):
+            chatter = FakeMessage(channel, author, ' '.join(rng.choice(WORDS) for _ in range(8)))
+            channel.messages.append(chatter)
+            await bot.on_message(chatter)
+        content = f"<@{BOT_ID}> what do you know about {rng.choice(names)} and the {rng.choice(WORDS)}?"
+        message = FakeMessage(channel, author, content, mentions=[BOT_USER])
+        channel.messages.append(message)
+        async with semaphore:
+            stages = {}
+            token = _stages.set(stages)
+            start = time.perf_counter()
+            try:
+                await bot.on_message(message)
+            finally:
+                _stages.reset(token)
+            stages['total'] = time.perf_counter() - start
+        for stage, seconds in stages.items():
+            samples.setdefault(stage, []).append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.mentions)))
+    elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+async def run_commands(bot, args, rng):
+    samples = {}
+    commands = {
+        'lore_profile': lambda i: bot.lore_profile.callback(FakeInteraction(FakeUser(rng.randint(1, args.users), 'x'), args.discord_latency)),
+        'lore_stories': lambda i: bot.lore_stories.callback(FakeInteraction(FakeUser(1, 'x'), args.discord_latency), homeworld=rng.choice(HOMEWORLDS)),
+        'lore_stories_query': lambda i: bot.lore_stories.callback(FakeInteraction(FakeUser(1, 'x'), args.discord_latency), query=rng.choice(WORDS)),
+    }
+    for name, invoke in commands.items():
+        for i in range(args.commands):
+            start = time.perf_counter()
+            await invoke(i)
+            samples.setdefault(name, []).append(time.perf_counter() - start)
+    return samples
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CHATBOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args):
+    rng = random.Random(args.seed)
+    stub, base_url = await start_stub_server(args, rng)
+    tmp = tempfile.mkdtemp(prefix='echo-bench-')
+
+    # bot.py reads its configuration at import time
+    os.environ.setdefault('LORE_BOT_TOKEN', 'bench')
+    os.environ['GROQ_API_KEY'] = 'bench'
+    os.environ['GROQ_BASE_URL'] = base_url
+    import database
+    database.DB_NAME = os.path.join(tmp, 'lore.db')
+    import bot
+    bot.STREAM_REPLIES = args.stream
+
+    bot.client._connection.user = BOT_USER
+
+    async def no_sync(*a, **kw):
+        return []
+    bot.tree.sync = no_sync
+
+    await database.init_db()
+    names = await seed(database, args, rng)
+    await bot.client.setup_hook()
+    await bot.on_ready()
+    instrument(bot, database)
+
+    channels = [FakeChannel(1000 + i, args.discord_latency) for i in range(args.channels)]
+    try:
+        mention_samples, elapsed = await run_mentions(bot, args, rng, channels, names)
+        command_samples = await run_commands(bot, args, rng)
+    finally:
+        await bot.user_registry.stop()
+        await bot.groq_client.close()
+        await database.close_db()
+        await stub.cleanup()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': vars(args),
+        'throughput_mentions_per_sec': args.mentions / elapsed,
+        'stages': {stage: percentiles(s) for stage, s in sorted(mention_samples.items())},
+        'commands': {name: percentiles(s) for name, s in command_samples.items()},
+    }
+    return results
+
+def print_results(results, baseline=None):
+    print(f"commit {results['commit']}  throughput {results['throughput_mentions_per_sec']:.1f} mentions/sec")
+    for section in ('stages', 'commands'):
+        print(f"\n{section:<20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, stats in results[section].items():
+            line = f"{name:<20} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+            before = (baseline or {}).get(section, {}).get(name)
+            if before:
+                line += f"   p95 {stats['p95_ms'] - before['p95_ms']:+.2f} ms vs {baseline['commit']}"
+            print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--aliases', type=int, default=1_000)
+    parser.add_argument('--info', type=int, default=20_000, help='information rows')
+    parser.add_argument('--stories', type=int, default=500)
+    parser.add_argument('--mentions', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8, help='mentions in flight at once')
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--senders', type=int, default=50)
+    parser.add_argument('--chatter', type=int, default=2, help='non-mention messages before each mention')
+    parser.add_argument('--commands', type=int, default=50, help='invocations per slash command')
+    parser.add_argument('--llm-latency', type=float, default=300, help='stub time to first token, ms')
+    parser.add_argument('--token-interval', type=float, default=5, help='stub delay between streamed chunks, ms')
+    parser.add_argument('--discord-latency', type=float, default=40, help='simulated Discord REST latency, ms')
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--compare', help='results JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    results = asyncio.run(main(args))
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark for NameResolver against database.search_user_by_name.
+
+Usage (from the chatbot directory):
+    python benchmarks/bench_resolver.py [--users 100000] [--aliases 20000] [--lookups 2000]
+
+Builds a throwaway database with synthetic users and aliases, then times the
+same lookups through the in-memory resolver and the old per-word SQL search.
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+from resolver import NameResolver
+
+def random_name(rng):
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(rng.randint(5, 14)))
+
+def build_lookups(rng, names, aliases, count):
+    """A mix of exact names, exact aliases, substrings, short words and misses."""
+    lookups = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            lookups.append(rng.choice(names))
+        elif kind == 1:
+            lookups.append(rng.choice(aliases))
+        elif kind == 2:
+            name = rng.choice(names)
+            start = rng.randint(0, len(name) - 4)
+            lookups.append(name[start:start + 4].upper())
+        elif kind == 3:
+            lookups.append(rng.choice(['hi', 'ok', 'a', 'go', 'yo']))
+        else:
+            lookups.append('zz' + random_name(rng) + '0')
+    return lookups
+
+def report(label, count, seconds):
+    print(f"{label:<32} {count:>7} lookups  {seconds * 1000:>9.1f} ms total  {seconds / count * 1e6:>9.1f} us/lookup")
+
+async def main(args):
+    rng = random.Random(args.seed)
+    tmp = tempfile.mkdtemp(prefix='echo-bench-')
+    database.DB_NAME = os.path.join(tmp, 'lore.db')
+    await database.init_db()
+    try:
+        users = [(i + 1, random_name(rng)) for i in range(args.users)]
+        await database.upsert_users(users)
+        alias_rows = [(rng.randint(1, args.users), random_name(rng)) for _ in range(args.aliases)]
+        async with database._write() as db:
+            await db.executemany('INSERT INTO user_aliases (user_id, alias) VALUES (?, ?)', alias_rows)
+
+        resolver = NameResolver()
+        start = time.perf_counter()
+        await resolver.load()
+        print(f"Resolver load: {(time.perf_counter() - start) * 1000:.1f} ms for {args.users} users / {args.aliases} aliases")
+
+        lookups = build_lookups(rng, [n for _, n in users], [a for _, a in alias_rows], args.lookups)
+
+        start = time.perf_counter()
+        resolved = [resolver.resolve(term) for term in lookups]
+        report('NameResolver.resolve', len(lookups), time.perf_counter() - start)
+
+        # Second pass: short terms are memoised after the first scan
+        start = time.perf_counter()
+        for term in lookups:
+            resolver.resolve(term)
+        report('NameResolver.resolve (warm)', len(lookups), time.perf_counter() - start)
+
+        sql_lookups = lookups[:args.sql_lookups]
+        start = time.perf_counter()
+        sql_resolved = [await database.search_user_by_name(term) for term in sql_lookups]
+        report('database.search_user_by_name', len(sql_lookups), time.perf_counter() - start)
+
+        # The old SQL uses ASCII LOWER(), the resolver casefolds; with ASCII names they agree
+        mismatches = sum(1 for a, b in zip(resolved, sql_resolved) if a != b)
+        print(f"Result mismatches vs SQL: {mismatches}/{len(sql_lookups)}")
+    finally:
+        await database.close_db()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--aliases', type=int, default=20_000)
+    parser.add_argument('--lookups', type=int, default=2_000)
+    parser.add_argument('--sql-lookups', type=int, default=200, help='SQL is slow; time a smaller sample')
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""
+Checks that the hot lookup queries use indexes, via EXPLAIN QUERY PLAN.
+
+Usage (from the chatbot directory):
+    python benchmarks/check_query_plans.py [--db path/to/lore.db]
+
+Runs init_db() (and so every migration) on a throwaway database, or on a
+copy of --db, then fails with exit status 1 if any query below scans a table
+instead of searching an index, or sorts its results when it shouldn't.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+# (description, SQL, params, index the plan must use, whether a sort step is acceptable).
+# The SQL comes from database.py, so the check covers exactly what the bot runs.
+QUERIES = [
+    # The sort only covers one user's facts
+    ('profile information', database.PROFILE_INFORMATION_SQL, (1,), 'idx_information_dedup', True),
+    ('profile aliases', database.PROFILE_ALIASES_SQL, (1,), 'idx_user_aliases_user', False),
+    ('homeworld stories', database.HOMEWORLD_STORIES_SQL, ('Naboo', 3), 'idx_stories_homeworld_page', False),
+    ('general stories', database.GENERAL_STORIES_SQL, (3,), 'idx_stories_homeworld_page', False),
+    ('recent stories', database.RECENT_STORIES_SQL, (3,), 'idx_stories_page', False),
+    ('story page', database.story_page_sql(False), (11,), 'idx_stories_page', False),
+    ('story page older', database.story_page_sql(False, 'before'), ('2024-01-01 00:00:00', 1000, 11),
+     'idx_stories_page', False),
+    ('homeworld page newer', database.story_page_sql(True, 'after'), ('Naboo', '2024-01-01 00:00:00', 1000, 11),
+     'idx_stories_homeworld_page', False),
+    ('exact name', database.NAME_EXACT_SQL, ('slater',), 'idx_users_name_nocase', False),
+    ('exact alias', database.ALIAS_EXACT_SQL, ('swift',), 'idx_user_aliases_alias_nocase', False),
+]
+
+async def check():
+    failures = 0
+    async with database._read() as db:
+        for description, sql, params, index, sort_ok in QUERIES:
+            async with db.execute(f'EXPLAIN QUERY PLAN {sql}', params) as cursor:
+                plan = [row[3] for row in await cursor.fetchall()]
+            uses_index = any(index in step for step in plan)
+            full_scan = any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)
+            sorts = any(step.startswith('USE TEMP B-TREE') for step in plan)
+            ok = uses_index and not full_scan and (sort_ok or not sorts)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {description:<20} {' / '.join(plan)}")
+    return failures
+
+async def main(args):
+    tmp = tempfile.mkdtemp(prefix='echo-plans-')
+    database.DB_NAME = os.path.join(tmp, 'lore.db')
+    if args.db:
+        shutil.copyfile(args.db, database.DB_NAME)
+    await database.init_db()
+    try:
+        failures = await check()
+    finally:
+        await database.close_db()
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='check a copy of an existing lore.db (it is not modified)')
+    sys.exit(1 if asyncio.run(main(parser.parse_args())) else 0)
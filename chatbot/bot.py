@@ -1,11 +1,27 @@
 import discord
 from discord import app_commands
+import asyncio
 import os
 import logging
 import re
+import hashlib
+import signal
+import tempfile
+import json
+import time
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq
+import archive
 import database  # Import our new database module
+import metrics
+from coalesce import MentionCoalescer
+from history import ChannelHistory
+from llm import LLMPipeline
+from prompt import PromptAssembler
+from registry import UserRegistry
+from streaming import StreamingReply, split_reply
+from resolver import NameResolver
+from writer import WriterClient
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +31,51 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('LoreBot')
 
 # --- CONFIGURATION ---
+PROCESS_STARTED = time.monotonic()
 TOKEN = os.getenv('LORE_BOT_TOKEN')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL')  # Optional, e.g. a local OpenAI-compatible stub
 CONTEXT_LIMIT = 20  # Number of last messages to fetch
+HISTORY_MAX_BYTES = 8 * 1024 * 1024  # Memory cap for cached channel history across all channels
+USER_FLUSH_INTERVAL = 0.5  # Seconds between batched user writes
+USER_FLUSH_BATCH = 100  # Flush early once this many users are queued
+LLM_MAX_CONCURRENCY = 4  # Max completions in flight at once
+LLM_TIMEOUT = 60  # Seconds before a completion request is abandoned
+LLM_MAX_RETRIES = 3  # Retries on 429/5xx/connection errors
+STREAM_REPLIES = True  # Post replies while they are generated, editing them in place
+STREAM_EDIT_INTERVAL = 1.2  # Min seconds between edits of a streaming reply (Discord rate limits)
+STREAM_FIRST_CHARS = 40  # Visible characters needed before the first message is posted
+MEMORY_ONLY_REPLY = "Noted. I'll remember that."  # Sent when a reply held nothing but memory tags
+PROMPT_TOKEN_BUDGET = 6000  # Estimated tokens allowed for the prompt (system + context + history)
+PROMPT_MIN_HISTORY = 6  # History lines kept ahead of stories and non-essential facts
+PROMPT_FACT_LIMIT = 20  # Most relevant non-Identity/Homeworld facts offered per user
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Local Prometheus endpoint (127.0.0.1), 0 to disable
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None  # Total shards across all processes; unset lets discord.py choose
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i] or None  # Shards run by this process (see launcher.py)
+WRITER_SOCKET = os.getenv('LORE_WRITER_SOCKET')  # If set, database writes go to writer.py over this socket
+RESOLVER_RELOAD_DELAY = 2.0  # Seconds to wait for further import chunks before reloading names from another worker's import
+PRIMARY_PROCESS = SHARD_IDS is None or 0 in SHARD_IDS  # Runs the once-per-deployment jobs (command sync)
+SLOW_MENTION_SECONDS = 15  # Log a stage breakdown for mentions slower than this
+COALESCE_MENTIONS = False  # Answer bursts of mentions in a channel with one completion
+COALESCE_WINDOW = 2.0  # Seconds to gather mentions after the first one in a channel
+COALESCE_MAX_BATCH = 4  # Answer immediately once this many mentions are gathered
+STORY_PAGE_SIZE = 10  # Stories per /lore_stories page
+STORY_PAGER_TIMEOUT = 300  # Seconds the /lore_stories page buttons stay active
+
+# Arguments for every chat completion request
+COMPLETION_ARGS = dict(
+    model="openai/gpt-oss-20b",
+    temperature=0.7,
+    max_tokens=1024,
+)
+
+# Words never treated as a user name when resolving who a mention is about
+NAME_STOPWORDS = frozenset(['@echo', 'do', 'you', 'who', 'is', 'give', 'me', 'info', 'know', 'about', 'tell', 'any', 'information', 'the', 'of', 'and', 'for', 'this', 'that', 'they', 'them', 'their'])
+
+# Memory tags the model appends to replies: [[MEMORY: Category | Content]]
+MEMORY_PATTERN = re.compile(r"\[\[MEMORY:\s*(.*?)\s*\|\s*(.*?)\]\]")
+# Section markers in coalesced replies: [[REPLY 1]] ... [[REPLY 2]] ...
+REPLY_PATTERN = re.compile(r"\[\[REPLY\s+(\d+)\]\]")
 
 # --- SYSTEM PROMPT ---
 # Modify this string to change the bot's personality and lore.
@@ -44,9 +102,84 @@ Do not output this tag for trivial conversation. Only for facts worth rememberin
 # --- BOT SETUP ---
 intents = discord.Intents.default()
 intents.message_content = True
-client = discord.Client(intents=intents)
+
+class LoreClient(discord.AutoShardedClient):
+    _sigterm_close = None
+
+    async def setup_hook(self):
+        # Runs once after login, before the gateway connects; not repeated on reconnects
+        global metrics_runner
+        # launcher.py stops workers with SIGTERM; only SIGINT would otherwise reach close()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.handle_sigterm)
+        if METRICS_PORT:
+            try:
+                metrics_runner = await metrics.start_server(port=METRICS_PORT)
+            except Exception as e:
+                logger.error(f"Failed to start metrics endpoint: {e}")
+
+        # Initialize the database
+        try:
+            if WRITER_SOCKET:
+                writer = WriterClient(WRITER_SOCKET)
+                writer.on_write = apply_remote_write
+                await writer.connect()
+                await database.init_db(writer=writer)
+            else:
+                await database.init_db()
+            logger.info("Database connection initialized.")
+            await user_registry.load()
+            await name_resolver.load()
+            user_registry.start()
+        except Exception as e:
+            logger.error(f"Failed to initialize database: {e}")
+
+        if PRIMARY_PROCESS:
+            await sync_commands()
+
+    def handle_sigterm(self):
+        if self._sigterm_close is None:
+            logger.info("SIGTERM received, shutting down...")
+            self._sigterm_close = asyncio.create_task(self.close())
+
+    async def close(self):
+        # Answer gathered mentions, flush queued users, then release pooled database connections
+        try:
+            await mention_coalescer.close()
+        except Exception as e:
+            logger.error(f"Failed to answer gathered mentions: {e}")
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        try:
+            await user_registry.stop()
+        except Exception as e:
+            logger.error(f"Failed to flush user registry: {e}")
+        try:
+            await groq_client.close()
+        except Exception as e:
+            logger.error(f"Failed to close Groq client: {e}")
+        try:
+            await database.close_db()
+        except Exception as e:
+            logger.error(f"Failed to close database: {e}")
+        await super().close()
+
+client = LoreClient(intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 tree = app_commands.CommandTree(client)
-groq_client = Groq(api_key=GROQ_API_KEY)
+groq_client = AsyncGroq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, max_retries=0)
+llm = LLMPipeline(groq_client, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+channel_history = ChannelHistory(limit=CONTEXT_LIMIT, max_bytes=HISTORY_MAX_BYTES)
+name_resolver = NameResolver()
+prompt_assembler = PromptAssembler(SYSTEM_PROMPT, budget=PROMPT_TOKEN_BUDGET, min_history=PROMPT_MIN_HISTORY,
+                                   fact_limit=PROMPT_FACT_LIMIT)
+user_registry = UserRegistry(flush_interval=USER_FLUSH_INTERVAL, max_batch=USER_FLUSH_BATCH)
+metrics_runner = None
+
+# Values read when the metrics endpoint is scraped
+metrics.gauge('echo_llm_queue_depth', 'LLM requests waiting for a slot', lambda: llm.queue_depth)
+metrics.gauge('echo_llm_in_flight', 'LLM requests in flight', lambda: llm.in_flight)
+metrics.gauge('echo_profile_cache_entries', 'Cached user profiles', lambda: len(database.profile_cache))
+metrics.gauge('echo_history_bytes', 'Estimated size of cached channel history', lambda: channel_history.size)
+metrics.gauge('echo_user_registry_hits', 'Senders answered from the user registry', lambda: user_registry.stats['hits'])
 
 def is_authorized(user):
     """Check if user has permission to modify lore."""
@@ -61,32 +194,117 @@ def is_authorized(user):
     
     return False
 
-@client.event
-async def on_ready():
-    logger.info(f'Logged in as {client.user} (ID: {client.user.id})')
-    print(f'Logged in as {client.user}')
-    # Initialize the database
-    try:
-        await database.init_db()
-        logger.info("Database connection initialized.")
-    except Exception as e:
-        logger.error(f"Failed to initialize database: {e}")
-    
-    # Sync slash commands
+_resolver_reload = None
+_resolver_reload_requested = False
+
+def request_resolver_reload():
+    """Reload the name resolver in the background; requests made meanwhile share one follow-up reload."""
+    global _resolver_reload, _resolver_reload_requested
+    _resolver_reload_requested = True
+    if _resolver_reload is None or _resolver_reload.done():
+        _resolver_reload = asyncio.create_task(_reload_resolver())
+
+async def _reload_resolver():
+    global _resolver_reload_requested
+    while _resolver_reload_requested:
+        # Let the rest of a chunked import land before reloading
+        await asyncio.sleep(RESOLVER_RELOAD_DELAY)
+        _resolver_reload_requested = False
+        try:
+            await name_resolver.load()
+        except Exception as e:
+            logger.error(f"Failed to reload name resolver: {e}")
+
+def apply_remote_write(event):
+    """Keep in-memory name lookups in step with writes made by any shard worker."""
+    op = event['written']
+    if op in ('upsert_user', 'upsert_users'):
+        for discord_id, name in event['users']:
+            name_resolver.set_name(discord_id, name)
+    elif op == 'add_alias':
+        name_resolver.add_alias(event['alias_id'], event['discord_id'], event['alias'])
+    elif op == 'import_records' and event['kind'] in ('user', 'alias') and event['count']:
+        request_resolver_reload()
+
+def command_tree_hash():
+    """Hash of the command tree as it would be sent to Discord."""
+    commands = sorted((cmd.to_dict(tree) for cmd in tree.get_commands()), key=lambda c: c['name'])
+    payload = json.dumps({'application_id': client.application_id, 'commands': commands}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def sync_commands():
+    """Sync slash commands only if they changed since the last sync."""
     try:
+        tree_hash = command_tree_hash()
+        try:
+            synced_hash = await database.get_meta('command_tree_hash')
+        except Exception as e:
+            logger.error(f"Failed to read last command tree hash: {e}")
+            synced_hash = None
+        if synced_hash == tree_hash:
+            logger.info("Slash commands unchanged since last sync, skipping")
+            return
         await tree.sync()
         logger.info("✓ Slash commands synced with Discord")
+        await database.set_meta('command_tree_hash', tree_hash)
     except Exception as e:
         logger.error(f"Failed to sync commands: {e}")
 
+_shards_ready = set()
+_shard_disconnected_at = {}  # shard_id -> time.monotonic() of its first disconnect
+
+def channel_on_shard(channel_id: int, shard_id: int) -> bool:
+    """True if the channel's events arrive on `shard_id` (or the channel isn't cached)."""
+    channel = client.get_channel(channel_id)
+    if channel is None:
+        # Unknown, e.g. an uncached thread: assume it may have missed messages too
+        return True
+    guild = getattr(channel, 'guild', None)
+    # DMs are delivered to shard 0
+    return (guild.shard_id if guild else 0) == shard_id
+
+@client.event
+async def on_ready():
+    # Fires once, when every shard of this process is first ready; startup work lives in setup_hook
+    logger.info(f'Logged in as {client.user} (ID: {client.user.id}), shards {client.shard_ids or "all"} of {client.shard_count}')
+    print(f'Logged in as {client.user}')
+    logger.info(f"Ready {time.monotonic() - PROCESS_STARTED:.2f}s after process start")
+
+@client.event
+async def on_shard_ready(shard_id):
+    # Fires after every new session of a shard, including re-identifies after startup
+    disconnected_at = _shard_disconnected_at.pop(shard_id, None)
+    if shard_id not in _shards_ready:
+        _shards_ready.add(shard_id)
+        logger.info(f"Shard {shard_id} ready {time.monotonic() - PROCESS_STARTED:.2f}s after process start")
+    elif disconnected_at is not None:
+        logger.info(f"Shard {shard_id} ready again {time.monotonic() - disconnected_at:.2f}s after disconnect")
+    # A new gateway session may have missed messages; refetch this shard's history on next mention
+    channel_history.mark_cold(lambda channel_id: channel_on_shard(channel_id, shard_id))
+
+@client.event
+async def on_shard_disconnect(shard_id):
+    _shard_disconnected_at.setdefault(shard_id, time.monotonic())
+
+@client.event
+async def on_shard_resumed(shard_id):
+    # Resumed sessions replay missed events, so history stays warm
+    disconnected_at = _shard_disconnected_at.pop(shard_id, None)
+    if disconnected_at is not None:
+        logger.info(f"Shard {shard_id} resumed {time.monotonic() - disconnected_at:.2f}s after disconnect")
+
 @client.event
 async def on_message(message):
+    # Keep the rolling channel history current (including our own replies)
+    channel_history.append(message)
+
     # Ignore own messages
     if message.author == client.user:
         return
 
-    # Ensure user is in DB
-    await database.upsert_user(message.author.id, message.author.display_name)
+    # Ensure user is in DB (queued, written behind in batches)
+    if user_registry.observe(message.author.id, message.author.display_name):
+        name_resolver.set_name(message.author.id, message.author.display_name)
 
     # --- AI RESPONSE (on mention) ---
     # Check if mentioned
@@ -98,100 +316,228 @@ async def on_message(message):
             await message.reply("Ash message detected, ignoring...")
             return
 
-        async with message.channel.typing():
-            try:
-                # 1. Fetch Context
-                history = []
-                async for msg in message.channel.history(limit=CONTEXT_LIMIT):
-                    author_name = msg.author.display_name
-                    history.append(f"{author_name}: {msg.content}")
-                history.reverse()
-                context_str = "\n".join(history)
-
-                # 2. Fetch DB Context with homeworld awareness
-                # Check for mentioned users (excluding the bot itself)
-                mentioned_users = [u for u in message.mentions if u != client.user]
-                target_id = mentioned_users[0].id if mentioned_users else message.author.id
-                target_user = mentioned_users[0] if mentioned_users else message.author
-                
-                # If no mentions, try to find users by name in the message content
-                if not mentioned_users and target_id == message.author.id:
-                    # Extract potential names from message (words that start with capitals or look like names)
-                    words = message.content.split()
-                    for word in words:
-                        # Skip common words and the bot mention
-                        if word.lower() in ['@echo', 'do', 'you', 'who', 'is', 'give', 'me', 'info', 'know', 'about', 'tell', 'any', 'information', 'the', 'of', 'and', 'for', 'this', 'that', 'they', 'them', 'their']:
-                            continue
-                        # Try to find this word as a user name/alias
-                        clean_word = word.strip('@')
-                        found_id = await database.search_user_by_name(clean_word)
-                        if found_id:
-                            target_id = found_id
-                            logger.info(f"Found user by name search: {clean_word} -> {found_id}")
-                            break
-                
+        if COALESCE_MENTIONS:
+            # Answered together with other mentions arriving in this channel soon
+            mention_coalescer.submit(message)
+            return
+
+        with metrics.trace() as mention_trace:
+            await handle_mention(message)
+        log_if_slow(mention_trace)
+
+async def fetch_history(message):
+    """Channel history lines for the prompt, from the in-memory buffer (API only when cold)."""
+    with metrics.span('history'):
+        history = channel_history.lines(message.channel.id)
+        if history is None:
+            metrics.DISCORD_CALLS.inc(call='history')
+            fetched = [msg async for msg in message.channel.history(limit=CONTEXT_LIMIT)]
+            fetched.reverse()
+            channel_history.seed(message.channel.id, fetched)
+            history = [f"{msg.author.display_name}: {msg.content}" for msg in fetched]
+    return history
+
+def resolve_target(message):
+    """Work out which user a mention is about: an @user, a name in the text, or the author."""
+    # Check for mentioned users (excluding the bot itself)
+    mentioned_users = [u for u in message.mentions if u != client.user]
+    if mentioned_users:
+        return mentioned_users[0].id
+
+    # If no mentions, try to find users by name in the message content
+    # Extract potential names from message (words that start with capitals or look like names)
+    # Skip common words and the bot mention
+    candidates = [word.strip('@') for word in message.content.split() if word.lower() not in NAME_STOPWORDS]
+    # Resolve all candidates in one pass against the in-memory name/alias index
+    with metrics.span('resolve'):
+        clean_word, found_id = name_resolver.resolve_first(candidates)
+    if found_id:
+        logger.info(f"Found user by name search: {clean_word} -> {found_id}")
+        return found_id
+    return message.author.id
+
+async def fetch_stories(query: str, homeworld: str = None):
+    """Stories most relevant to the query (boosting the homeworld), else the most recent ones."""
+    with metrics.span('stories'):
+        stories = await database.search_stories(query, limit=2, homeworld=homeworld)
+        if not stories:
+            stories = await database.get_recent_stories(limit=2, homeworld=homeworld)
+    return stories
+
+async def store_memories(target_id: int, response_text: str) -> str:
+    """Save [[MEMORY]] tags from a reply for target_id. Returns the text without them."""
+    memories = MEMORY_PATTERN.findall(response_text)
+    if not memories:
+        return response_text
+    with metrics.span('memory'):
+        # One transaction; facts we already know are skipped
+        added = await database.add_information_bulk(target_id, [(category.strip(), content.strip()) for category, content in memories])
+    metrics.MEMORIES.inc(len(added), result='new')
+    metrics.MEMORIES.inc(len(memories) - len(added), result='duplicate')
+    if added:
+        logger.info(f"Stored {len(added)} new memories for {target_id}: {added}")
+    if len(added) < len(memories):
+        logger.info(f"Skipped {len(memories) - len(added)} memories already known for {target_id}")
+    return MEMORY_PATTERN.sub("", response_text).strip()
+
+async def send_reply(message, response_text: str):
+    chunks = split_reply(response_text)
+    metrics.DISCORD_CALLS.inc(len(chunks), call='reply')
+    await message.reply(chunks[0])
+    for chunk in chunks[1:]:
+        await message.channel.send(chunk)
+
+async def handle_mention(message):
+    """Generate and send a reply to a message that mentions the bot."""
+    streaming_reply = None
+    async with message.channel.typing():
+        try:
+            # Make sure the author's row exists before reading their profile
+            if user_registry.is_pending(message.author.id):
+                await user_registry.flush()
+
+            # 1. Fetch Context
+            history = await fetch_history(message)
+
+            # 2. Fetch DB Context with homeworld awareness
+            target_id = resolve_target(message)
+            with metrics.span('profile'):
                 author_profile = await database.get_user_profile(target_id)
-                author_context = ""
-                author_homeworld = None
-                if author_profile:
-                    aliases = ", ".join(author_profile.get('aliases', []))
-                    info_text = ""
-                    for cat, items in author_profile.get('information', {}).items():
-                        info_text += f"{cat}: " + "; ".join(items) + ". "
-                        if cat == "Homeworld" and items:
-                            author_homeworld = items[0]
-                    author_context = f"\n[User Context: This is {author_profile['name']}. Aliases: {aliases}. Known Info: {info_text}]"
-
-                # Get recent stories (prioritize user's homeworld)
-                recent_stories = await database.get_recent_stories(limit=2, homeworld=author_homeworld)
-                stories_context = ""
-                if recent_stories:
-                    stories_context = "\n[Relevant Lore/Stories in Database]\n"
-                    for s in recent_stories:
-                        content_snippet = s['content'][:200] + "..." if len(s['content']) > 200 else s['content']
-                        homeworld_tag = f" [From {s['homeworld']}]" if s['homeworld'] else ""
-                        stories_context += f"- Title: {s['title']}{homeworld_tag}\n  Snippet: {content_snippet}\n"
-
-                # 3. Construct Prompt for Groq
-                messages = [
-                    {"role": "system", "content": SYSTEM_PROMPT + author_context + stories_context},
-                    {"role": "user", "content": f"Here is the recent conversation history:\n---\n{context_str}\n---\n\nPlease respond to the last message from {message.author.display_name}. Remember to use [[MEMORY: Category | Content]] if you learn something new."}
-                ]
-
-                # 4. Call Groq API
-                chat_completion = groq_client.chat.completions.create(
-                    messages=messages,
-                    model="openai/gpt-oss-20b",
-                    temperature=0.7,
-                    max_tokens=1024,
-                )
+            author_homeworld = author_profile['homeworld'] if author_profile else None
+            recent_stories = await fetch_stories(message.content, author_homeworld)
 
-                response_text = chat_completion.choices[0].message.content
+            # 3. Construct Prompt for Groq (trimmed by priority to fit the token budget)
+            with metrics.span('prompt'):
+                messages = prompt_assembler.build(author_profile, recent_stories, history, message.author.display_name,
+                                                  message.content)
+
+            # 4. Call Groq API (queued per channel, off the event loop)
+            # (when streaming, progressive message edits run alongside in a background task)
+            with metrics.span('llm'):
+                if STREAM_REPLIES:
+                    # Post the reply as it arrives; memory tags are held back from display
+                    streaming_reply = StreamingReply(message, MEMORY_PATTERN, edit_interval=STREAM_EDIT_INTERVAL, min_first_chars=STREAM_FIRST_CHARS)
+                    response_text = await llm.stream(message.channel.id, streaming_reply.feed, **COMPLETION_ARGS, messages=messages)
+                else:
+                    chat_completion = await llm.complete(message.channel.id, **COMPLETION_ARGS, messages=messages)
+                    response_text = chat_completion.choices[0].message.content
+
+            # 5. Process Memories
+            response_text = await store_memories(target_id, response_text)
+            if not response_text:
+                logger.warning(f"Reply to message {message.id} was only memory tags; sending {MEMORY_ONLY_REPLY!r}")
+                response_text = MEMORY_ONLY_REPLY
 
-                # 5. Process Memories
-                memory_pattern = r"\[\[MEMORY:\s*(.*?)\s*\|\s*(.*?)\]\]"
-                memories = re.findall(memory_pattern, response_text)
-                
-                if memories:
-                    logger.info(f"Found memories: {memories}")
-                    for category, content in memories:
-                        await database.add_information(target_id, category.strip(), content.strip())
-                    
-                    response_text = re.sub(memory_pattern, "", response_text).strip()
-
-                # 6. Send Reply
-                if len(response_text) <= 2000:
-                    await message.reply(response_text)
+            # 6. Send Reply
+            with metrics.span('reply'):
+                if STREAM_REPLIES:
+                    await streaming_reply.finish(response_text)
                 else:
-                    chunk_size = 1900
-                    chunks = [response_text[i:i+chunk_size] for i in range(0, len(response_text), chunk_size)]
-                    await message.reply(chunks[0])
-                    for chunk in chunks[1:]:
-                        await message.channel.send(chunk)
+                    await send_reply(message, response_text)
+
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            if streaming_reply is not None:
+                # Don't leave a half-written reply (or a pending edit to it) behind the error
+                await streaming_reply.abort()
+            await message.reply(f"I... I seem to have lost my train of thought. (An error occurred: {e})")
+
+async def handle_mention_batch(batch):
+    """
+    Answer several mentions from one channel with a single completion.
+    The model writes one [[REPLY n]] section per asker; each section is posted
+    as a reply to that message and its memory tags are stored for that asker's target.
+    """
+    if len(batch) == 1:
+        with metrics.trace() as mention_trace:
+            await handle_mention(batch[0])
+        log_if_slow(mention_trace)
+        return
+
+    leftover = []
+    answered = set()  # ids of messages that already got their section
+    with metrics.trace() as mention_trace:
+        async with batch[-1].channel.typing():
+            try:
+                if any(user_registry.is_pending(m.author.id) for m in batch):
+                    await user_registry.flush()
+
+                history = await fetch_history(batch[-1])
+                target_ids = [resolve_target(m) for m in batch]
+                with metrics.span('profile'):
+                    profiles = [await database.get_user_profile(target_id) for target_id in target_ids]
+                first_homeworld = next((p['homeworld'] for p in profiles if p and p['homeworld']), None)
+                recent_stories = await fetch_stories(" ".join(m.content for m in batch), first_homeworld)
+
+                with metrics.span('prompt'):
+                    askers = [(m.author.display_name, m.content, p) for m, p in zip(batch, profiles)]
+                    messages = prompt_assembler.build_batch(askers, recent_stories, history)
+
+                with metrics.span('llm'):
+                    chat_completion = await llm.complete(batch[-1].channel.id, **COMPLETION_ARGS, messages=messages)
+                response_text = chat_completion.choices[0].message.content
+
+                sections = split_batch_reply(response_text, len(batch))
+                for message, target_id, section in zip(batch, target_ids, sections):
+                    if section is None:
+                        leftover.append(message)
+                        continue
+                    section = await store_memories(target_id, section)
+                    if not section:
+                        leftover.append(message)
+                        continue
+                    with metrics.span('reply'):
+                        await send_reply(message, section)
+                    answered.add(message.id)
+                logger.info(f"Answered {len(batch) - len(leftover)} coalesced mentions with one completion")
 
             except Exception as e:
-                logger.error(f"Error generating response: {e}")
-                await message.reply(f"I... I seem to have lost my train of thought. (An error occurred: {e})")
+                logger.error(f"Error generating coalesced response: {e}")
+                # Everyone not answered yet gets the error instead of a second attempt
+                leftover = []
+                for message in batch:
+                    if message.id not in answered:
+                        await message.reply(f"I... I seem to have lost my train of thought. (An error occurred: {e})")
+    log_if_slow(mention_trace)
+
+    # Anyone the model skipped gets an individual answer
+    for message in leftover:
+        with metrics.trace() as mention_trace:
+            await handle_mention(message)
+        log_if_slow(mention_trace)
+
+def split_batch_reply(response_text: str, count: int):
+    """Split a coalesced completion into per-asker sections (None where one is missing)."""
+    sections = [None] * count
+    parts = REPLY_PATTERN.split(response_text)
+    # parts: [preamble, n1, text1, n2, text2, ...]
+    for number, text in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and sections[index] is None:
+            sections[index] = text.strip()
+    return sections
+
+def log_if_slow(mention_trace):
+    if mention_trace.total > SLOW_MENTION_SECONDS:
+        logger.warning(f"Slow mention ({mention_trace.total:.2f}s): {mention_trace.describe()}")
+
+mention_coalescer = MentionCoalescer(handle_mention_batch, window=COALESCE_WINDOW, max_batch=COALESCE_MAX_BATCH)
+
+@client.event
+async def on_raw_message_edit(payload):
+    # Raw events fire even when the message has left discord.py's message cache
+    content = payload.data.get('content')
+    if content is not None:
+        channel_history.edit(payload.channel_id, payload.message_id, content)
+
+@client.event
+async def on_raw_message_delete(payload):
+    channel_history.delete(payload.channel_id, payload.message_id)
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        channel_history.delete(payload.channel_id, message_id)
 
 # --- SLASH COMMANDS ---
 
@@ -213,18 +559,81 @@ async def lore_profile(interaction: discord.Interaction, user: discord.User = No
     else:
         await interaction.followup.send("User profile not found. (Any interaction will create a basic profile)")
 
-@tree.command(name="lore_stories", description="View recent lore stories")
-async def lore_stories(interaction: discord.Interaction, homeworld: str = None):
-    """View recent stories, optionally filtered by homeworld"""
+class StoryPager(discord.ui.View):
+    """Newer/Older buttons for /lore_stories. Each page is one keyset query."""
+
+    def __init__(self, homeworld: str, stories, more: bool):
+        super().__init__(timeout=STORY_PAGER_TIMEOUT)
+        self.homeworld = homeworld
+        self.stories = stories
+        self.page = 1
+        self.message = None
+        self.set_buttons(newer=False, older=more)
+
+    def set_buttons(self, newer: bool, older: bool):
+        self.newer.disabled = not newer
+        self.older.disabled = not older
+
+    def render(self) -> str:
+        heading = f"Stories from {self.homeworld}" if self.homeworld else "Stories"
+        lines = []
+        for s in self.stories:
+            homeworld_tag = f" [From {s['homeworld']}]" if s['homeworld'] and not self.homeworld else ""
+            lines.append(f"- **{s['title'] or 'Untitled'}**{homeworld_tag} ({s['created_at']})")
+        return f"**{heading}, page {self.page}:**\n" + "\n".join(lines)
+
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        first = self.stories[0]
+        stories, more = await database.get_story_page(STORY_PAGE_SIZE, self.homeworld, after=(first['created_at'], first['id']))
+        if stories:
+            self.stories = stories
+            self.page = max(self.page - 1, 1)
+        self.set_buttons(newer=more, older=True)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        last = self.stories[-1]
+        stories, more = await database.get_story_page(STORY_PAGE_SIZE, self.homeworld, before=(last['created_at'], last['id']))
+        if stories:
+            self.stories = stories
+            self.page += 1
+        self.set_buttons(newer=True, older=more)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    async def on_timeout(self):
+        self.set_buttons(newer=False, older=False)
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+@tree.command(name="lore_stories", description="Browse lore stories, or search them")
+async def lore_stories(interaction: discord.Interaction, homeworld: str = None, query: str = None):
+    """Browse stories page by page, optionally filtered by homeworld, or search them by query"""
     await interaction.response.defer()
-    stories = await database.get_recent_stories(limit=5, homeworld=homeworld)
+    if not query:
+        stories, more = await database.get_story_page(STORY_PAGE_SIZE, homeworld)
+        if not stories:
+            await interaction.followup.send("No stories found.")
+            return
+        pager = StoryPager(homeworld, stories, more)
+        pager.message = await interaction.followup.send(pager.render(), view=pager)
+        return
+
+    # An explicit homeworld filters, as it does when browsing (mentions only boost it)
+    stories = await database.search_stories(query, limit=5, homeworld=homeworld, only_homeworld=True)
     if stories:
         story_lines = []
         for s in stories:
             homeworld_tag = f" [From {s['homeworld']}]" if s['homeworld'] else ""
             story_lines.append(f"- **{s['title']}**{homeworld_tag}")
+            if 'snippet' in s:
+                story_lines.append(f"  > {s['snippet']}")
         list_str = "\n".join(story_lines)
-        await interaction.followup.send(f"**Recent Stories:**\n{list_str}")
+        await interaction.followup.send(f"**Stories matching '{query}':**\n{list_str}")
     else:
         await interaction.followup.send("No stories found.")
 
@@ -235,7 +644,8 @@ async def lore_add_alias(interaction: discord.Interaction, alias: str):
         await interaction.response.send_message("You do not have permission to add lore to the archives.", ephemeral=True)
         return
     
-    await database.add_alias(interaction.user.id, alias)
+    alias_id = await database.add_alias(interaction.user.id, alias)
+    name_resolver.add_alias(alias_id, interaction.user.id, alias)
     await interaction.response.send_message(f"✓ Added alias '{alias}' for {interaction.user.display_name}")
 
 @tree.command(name="lore_add_info", description="Add personal information about yourself")
@@ -246,8 +656,10 @@ async def lore_add_info(interaction: discord.Interaction, category: str, content
         return
     
     try:
-        await database.add_information(interaction.user.id, category, content)
-        await interaction.response.send_message(f"✓ Added info to category '{category}'.")
+        if await database.add_information(interaction.user.id, category, content):
+            await interaction.response.send_message(f"✓ Added info to category '{category}'.")
+        else:
+            await interaction.response.send_message(f"That info is already recorded in category '{category}'.", ephemeral=True)
     except Exception as e:
         logger.error(f"Error adding info: {e}")
         await interaction.response.send_message("Failed to add info.", ephemeral=True)
@@ -267,17 +679,45 @@ async def lore_add_story(interaction: discord.Interaction, title: str, content:
         logger.error(f"Error adding story: {e}")
         await interaction.response.send_message("Failed to add story.", ephemeral=True)
 
+@tree.command(name="lore_import", description="Import a JSONL lore archive into the database")
+async def lore_import(interaction: discord.Interaction, file: discord.Attachment):
+    """Bulk import users, aliases, information and stories (authorized users only)"""
+    if not is_authorized(interaction.user):
+        await interaction.response.send_message("You do not have permission to add lore to the archives.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        # Stream through a temp file rather than holding the whole archive in memory
+        with tempfile.TemporaryDirectory(prefix='lore-import-') as tmp:
+            path = os.path.join(tmp, os.path.basename(file.filename) or 'archive.jsonl')
+            await archive.download(file.url, path)
+            source = archive.open_archive(path, 'r')
+            try:
+                read, written = await archive.import_jsonl(source)
+            finally:
+                source.close()
+        # Imported users and aliases must be resolvable straight away
+        await user_registry.flush()
+        await user_registry.load()
+        await name_resolver.load()
+        await interaction.followup.send(f"✓ Imported {read} records from '{file.filename}' ({written} new or updated).")
+    except Exception as e:
+        logger.error(f"Error importing archive: {e}")
+        await interaction.followup.send(f"Failed to import archive: {e}")
+
 @tree.command(name="lore_help", description="Show LoreKeeper commands")
 async def lore_help(interaction: discord.Interaction):
     """Show available commands"""
     help_text = """**LoreKeeper Commands:**
 `/lore_profile [user]` - View your profile or another user's
-`/lore_stories [homeworld]` - List recent stories, optionally from a homeworld
+`/lore_stories [homeworld] [query]` - Browse stories page by page, optionally from a homeworld, or search them
 
 **Authorized Users Only (Swift & Slater):**
 `/lore_add_alias <alias>` - Add an alias for yourself
 `/lore_add_info <category> <content>` - Add info about yourself
-`/lore_add_story <title> <content> [homeworld]` - Add a lore story"""
+`/lore_add_story <title> <content> [homeworld]` - Add a lore story
+`/lore_import <file>` - Import a JSONL lore archive (see archive.py)"""
     await interaction.response.send_message(help_text)
 
 if __name__ == '__main__':
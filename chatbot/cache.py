@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Size-bounded LRU cache whose entries expire after `ttl` seconds.
+
+    `version` increases on every invalidation. Readers that load a value from
+    the database should pass the version they saw before loading to set(),
+    so a result that raced with a write is not cached.
+
+    `on_invalidate`, if set, is called with the key after every invalidate()
+    and with None after clear(), e.g. to forward invalidations to other processes.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.on_invalidate = None
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+            return default
+        self._data.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    def set(self, key, value, version: int = None):
+        if version is not None and version != self.version:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, key):
+        self.version += 1
+        self.stats['invalidations'] += 1
+        self._data.pop(key, None)
+        if self.on_invalidate is not None:
+            self.on_invalidate(key)
+
+    def clear(self):
+        self.version += 1
+        self._data.clear()
+        if self.on_invalidate is not None:
+            self.on_invalidate(None)
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('LoreBot.Coalesce')
+
+class MentionCoalescer:
+    """
+    Gathers mentions per channel for a short window and hands them to
+    `handler` as one batch.
+
+    The window opens with the first mention in a channel. The batch is handled
+    when the window closes or as soon as `max_batch` mentions are waiting.
+    """
+
+    def __init__(self, handler, window: float = 2.0, max_batch: int = 4):
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # channel_id -> [message, ...]
+        self._timers = {}   # channel_id -> TimerHandle
+        self._tasks = set()
+        self.stats = {'mentions': 0, 'batches': 0, 'coalesced': 0, 'max_batch_size': 0}
+
+    def submit(self, message):
+        channel_id = message.channel.id
+        batch = self._pending.setdefault(channel_id, [])
+        batch.append(message)
+        self.stats['mentions'] += 1
+        if len(batch) >= self.max_batch:
+            self._flush(channel_id)
+        elif len(batch) == 1:
+            self._timers[channel_id] = asyncio.get_running_loop().call_later(self.window, self._flush, channel_id)
+
+    def _flush(self, channel_id: int):
+        timer = self._timers.pop(channel_id, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(channel_id, None)
+        if not batch:
+            return
+        self.stats['batches'] += 1
+        if len(batch) > 1:
+            self.stats['coalesced'] += len(batch)
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            await self.handler(batch)
+        except Exception as e:
+            logger.error(f"Failed to handle {len(batch)} gathered mentions: {e}")
+
+    async def close(self):
+        """Handle everything still gathered and wait for running batches."""
+        for channel_id in list(self._pending):
+            self._flush(channel_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,13 +1,292 @@
 import aiosqlite
+import asyncio
+import functools
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
 import json
+import re
+import sqlite3
+import metrics
+from cache import LRUCache
+from facts import FactIndex, clean_fact, fact_hash
 
 DB_NAME = 'lore.db'
+READER_POOL_SIZE = 4  # Read-only connections kept open alongside the single writer
+STATEMENT_CACHE_SIZE = 128  # Prepared statements cached per connection
+PROFILE_CACHE_SIZE = 2048  # Assembled user profiles kept in memory
+PROFILE_CACHE_TTL = 600  # Seconds before a cached profile is reloaded
+DEFAULT_CATEGORY = 'General'  # Stored for facts without a category (NULLs would escape the dedup index)
 logger = logging.getLogger('LoreBot.Database')
 
-async def init_db():
-    async with aiosqlite.connect(DB_NAME) as db:
+# Pragmas applied to every pooled connection.
+# WAL lets readers run while the writer holds a transaction.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 67108864',
+)
+
+# Assembled profiles by discord_id. Writers below invalidate entries.
+profile_cache = LRUCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+# Relevance indexes over each user's facts by discord_id. New facts are added
+# in place; anything that removes facts invalidates the entry.
+fact_indexes = LRUCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+# --- CONNECTION POOL ---
+# Opened once by init_db() and shared by every query in this module.
+# Shard workers have no writer of their own: _remote_writer (a
+# writer.WriterClient) forwards their writes to the writer service instead.
+_writer = None
+_write_lock = None
+_readers = None
+_remote_writer = None
+
+class _CountedConnection:
+    """
+    An aiosqlite connection that counts each statement it runs in
+    metrics.DB_QUERIES (executemany() counts once). Everything else is passed through.
+    """
+    __slots__ = ('_db', '_mode')
+
+    def __init__(self, db, mode: str):
+        self._db = db
+        self._mode = mode
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def execute(self, *args, **kwargs):
+        metrics.DB_QUERIES.inc(mode=self._mode)
+        return self._db.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        metrics.DB_QUERIES.inc(mode=self._mode)
+        return self._db.executemany(*args, **kwargs)
+
+    def executescript(self, *args, **kwargs):
+        metrics.DB_QUERIES.inc(mode=self._mode)
+        return self._db.executescript(*args, **kwargs)
+
+async def _open_connection(read_only: bool = False):
+    db = await aiosqlite.connect(DB_NAME, cached_statements=STATEMENT_CACHE_SIZE)
+    db.row_factory = aiosqlite.Row
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+    if read_only:
+        await db.execute('PRAGMA query_only = ON')
+    return _CountedConnection(db, 'read' if read_only else 'write')
+
+def _require_pool():
+    if _readers is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+
+@asynccontextmanager
+async def _read():
+    """Borrow a read-only connection from the pool."""
+    _require_pool()
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+@asynccontextmanager
+async def _write():
+    """
+    Run a write transaction on the shared writer connection.
+    Commits on success, rolls back on error.
+    """
+    _require_pool()
+    if _writer is None:
+        raise RuntimeError("This process has no writer connection; writes go through the writer service.")
+    async with _write_lock:
+        try:
+            yield _writer
+            await _writer.commit()
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+# Functions that write, by name. The writer service runs these on behalf of shard workers.
+WRITE_OPERATIONS = {}
+
+def _writes(func):
+    """
+    Registers a write function. When this process uses a remote writer,
+    calls are forwarded to the writer service instead of running locally.
+    """
+    WRITE_OPERATIONS[func.__name__] = func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _remote_writer is not None:
+            return await _remote_writer.call(func.__name__, *args, **kwargs)
+        return await func(*args, **kwargs)
+    return wrapper
+
+# --- MIGRATIONS ---
+# Schema changes applied on top of the base tables created in init_db().
+# PRAGMA user_version records how many have run; each one runs in its own
+# transaction. Entries are SQL scripts or async callables taking the connection.
+# Only ever append to this list.
+async def _add_information_hashes(db):
+    """Adds content_hash to information, drops existing duplicates and enforces uniqueness."""
+    await db.execute('ALTER TABLE information ADD COLUMN content_hash TEXT')
+    seen = set()
+    updates = []
+    duplicates = []
+    async with db.execute('SELECT id, user_id, category, content FROM information ORDER BY id') as cursor:
+        async for row in cursor:
+            content_hash = fact_hash(row['content'])
+            key = (row['user_id'], row['category'], content_hash)
+            if key in seen:
+                duplicates.append((row['id'],))
+            else:
+                seen.add(key)
+                updates.append((content_hash, row['id']))
+    await db.executemany('UPDATE information SET content_hash = ? WHERE id = ?', updates)
+    await db.executemany('DELETE FROM information WHERE id = ?', duplicates)
+    await db.execute('CREATE UNIQUE INDEX idx_information_dedup ON information (user_id, category, content_hash)')
+    # The unique index also serves (user_id) and (user_id, category) lookups
+    await db.execute('DROP INDEX IF EXISTS idx_information_user_category')
+    logger.info(f"Hashed {len(updates)} information rows, removed {len(duplicates)} duplicates.")
+
+MIGRATIONS = [
+    # 1: Full-text index over stories (external content, kept in sync by triggers)
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5(
+        title, content, content='stories', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS stories_fts_insert AFTER INSERT ON stories BEGIN
+        INSERT INTO stories_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS stories_fts_delete AFTER DELETE ON stories BEGIN
+        INSERT INTO stories_fts (stories_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS stories_fts_update AFTER UPDATE ON stories BEGIN
+        INSERT INTO stories_fts (stories_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO stories_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END;
+    INSERT INTO stories_fts (stories_fts) VALUES ('rebuild');
+    ''',
+    # 2: Indexes for profile, homeworld, alias and story lookups, plus
+    #    case-insensitive name/alias lookup columns
+    '''
+    CREATE INDEX IF NOT EXISTS idx_information_user_category ON information (user_id, category);
+    CREATE INDEX IF NOT EXISTS idx_user_aliases_user ON user_aliases (user_id);
+    CREATE INDEX IF NOT EXISTS idx_stories_homeworld_created ON stories (homeworld, created_at);
+    CREATE INDEX IF NOT EXISTS idx_stories_created ON stories (created_at);
+    ALTER TABLE users ADD COLUMN name_nocase TEXT COLLATE NOCASE GENERATED ALWAYS AS (name) VIRTUAL;
+    CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users (name_nocase);
+    ALTER TABLE user_aliases ADD COLUMN alias_nocase TEXT COLLATE NOCASE GENERATED ALWAYS AS (alias) VIRTUAL;
+    CREATE INDEX IF NOT EXISTS idx_user_aliases_alias_nocase ON user_aliases (alias_nocase);
+    ''',
+    # 3: Normalised content hash with a unique index, so duplicate facts are never stored
+    _add_information_hashes,
+    # 4: Key/value store for bot state (e.g. the last synced command tree hash)
+    '''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    ''',
+    # 5: Covering (created_at, id) indexes for keyset-paginated story listings;
+    #    they also serve the recent-story lookups the old indexes were for
+    '''
+    CREATE INDEX IF NOT EXISTS idx_stories_page ON stories (created_at, id, title, homeworld);
+    CREATE INDEX IF NOT EXISTS idx_stories_homeworld_page ON stories (homeworld, created_at, id, title);
+    DROP INDEX IF EXISTS idx_stories_created;
+    DROP INDEX IF EXISTS idx_stories_homeworld_created;
+    ''',
+    # 6: Facts without a category become 'General', so the unique index (which
+    #    treats NULLs as distinct) deduplicates them; copies are dropped first
+    '''
+    DELETE FROM information WHERE category IS NULL AND (
+        EXISTS (SELECT 1 FROM information g WHERE g.user_id = information.user_id
+                AND g.category = 'General' AND g.content_hash = information.content_hash)
+        OR id NOT IN (SELECT MIN(id) FROM information WHERE category IS NULL GROUP BY user_id, content_hash)
+    );
+    UPDATE information SET category = 'General' WHERE category IS NULL;
+    ''',
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+async def _migrate(db):
+    async with db.execute('PRAGMA user_version') as cursor:
+        version = (await cursor.fetchone())[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"{DB_NAME} has schema version {version}, newer than this code ({SCHEMA_VERSION}).")
+
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Migrating {DB_NAME} to schema version {target}...")
+        await db.execute('BEGIN')
+        try:
+            if callable(migration):
+                await migration(db)
+            else:
+                # One statement at a time: executescript() would commit mid-migration
+                for statement in _split_sql(migration):
+                    await db.execute(statement)
+            await db.execute(f'PRAGMA user_version = {target}')
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+def _split_sql(script: str):
+    """Split an SQL script into complete statements (trigger bodies stay intact)."""
+    statements, current = [], ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip():
+                statements.append(current.strip())
+            current = ''
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+async def _open_readers():
+    readers = asyncio.Queue()
+    for _ in range(READER_POOL_SIZE):
+        readers.put_nowait(await _open_connection(read_only=True))
+    return readers
+
+async def init_db(writer=None):
+    """
+    Open the connection pool, creating and migrating the schema as needed.
+
+    Shard workers pass a connected writer.WriterClient as `writer`: they only
+    open read-only connections and forward every write to the writer service,
+    which owns the schema.
+    """
+    global _writer, _write_lock, _readers, _remote_writer
+    if _readers is not None:
+        return
+
+    if writer is not None:
+        readers = await _open_readers()
+        db = await readers.get()
+        async with db.execute('PRAGMA user_version') as cursor:
+            version = (await cursor.fetchone())[0]
+        readers.put_nowait(db)
+        if version != SCHEMA_VERSION:
+            for _ in range(READER_POOL_SIZE):
+                await (await readers.get()).close()
+            raise RuntimeError(f"{DB_NAME} has schema version {version}, expected {SCHEMA_VERSION}; "
+                               f"is the writer service running the same code?")
+        _readers = readers
+        _remote_writer = writer
+        logger.info(f"Database initialized ({READER_POOL_SIZE} readers, writes via the writer service).")
+        return
+
+    db = await _open_connection()
+    try:
         # Table: users
         # Stores Discord user definition
         await db.execute('''
@@ -54,48 +333,170 @@ async def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
         await db.commit()
-        logger.info("Database initialized.")
 
+        # Bring older lore.db files up to the current schema
+        await _migrate(db)
+    except BaseException:
+        await db.close()
+        raise
+
+    readers = await _open_readers()
+
+    _writer = db
+    _write_lock = asyncio.Lock()
+    _readers = readers
+    logger.info(f"Database initialized (WAL, 1 writer + {READER_POOL_SIZE} readers).")
+
+async def close_db():
+    """Close every pooled connection (and the remote writer, if any). Safe to call more than once."""
+    global _writer, _write_lock, _readers, _remote_writer
+    if _readers is None:
+        return
+    if _remote_writer is not None:
+        await _remote_writer.close()
+        _remote_writer = None
+    # Wait for borrowed readers to come back before closing them
+    readers, _readers = _readers, None
+    for _ in range(READER_POOL_SIZE):
+        db = await readers.get()
+        await db.close()
+    if _writer is not None:
+        async with _write_lock:
+            await _writer.close()
+            _writer = None
+        _write_lock = None
+    logger.info("Database connections closed.")
+
+@metrics.timed_db
+@_writes
 async def upsert_user(discord_id: int, name: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _write() as db:
         # Check if user exists
         async with db.execute('SELECT name FROM users WHERE discord_id = ?', (discord_id,)) as cursor:
             row = await cursor.fetchone()
-            if row:
-                # Update name if changed (optional, but good for keeping track)
-                if row[0] != name:
-                    await db.execute('UPDATE users SET name = ? WHERE discord_id = ?', (name, discord_id))
-                    await db.commit()
-            else:
-                await db.execute('INSERT INTO users (discord_id, name) VALUES (?, ?)', (discord_id, name))
-                await db.commit()
+        if row:
+            # Update name if changed (optional, but good for keeping track)
+            if row[0] != name:
+                await db.execute('UPDATE users SET name = ? WHERE discord_id = ?', (name, discord_id))
+        else:
+            await db.execute('INSERT INTO users (discord_id, name) VALUES (?, ?)', (discord_id, name))
+    profile_cache.invalidate(discord_id)
+
+@metrics.timed_db
+@_writes
+async def upsert_users(users):
+    """
+    Insert or rename many users in a single transaction.
+    `users` is an iterable of (discord_id, name) tuples.
+    """
+    async with _write() as db:
+        await db.executemany('''
+            INSERT INTO users (discord_id, name) VALUES (?, ?)
+            ON CONFLICT(discord_id) DO UPDATE SET name = excluded.name
+            WHERE name != excluded.name
+        ''', users)
+    for discord_id, _ in users:
+        profile_cache.invalidate(discord_id)
+
+@metrics.timed_db
+async def get_user_names():
+    """Returns a {discord_id: name} dict of every known user."""
+    async with _read() as db:
+        async with db.execute('SELECT discord_id, name FROM users') as cursor:
+            return {row['discord_id']: row['name'] async for row in cursor}
 
+@metrics.timed_db
+@_writes
 async def add_alias(discord_id: int, alias: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('INSERT INTO user_aliases (user_id, alias) VALUES (?, ?)', (discord_id, alias))
-        await db.commit()
+    """Adds an alias and returns its row id."""
+    async with _write() as db:
+        cursor = await db.execute('INSERT INTO user_aliases (user_id, alias) VALUES (?, ?)', (discord_id, alias))
+    profile_cache.invalidate(discord_id)
+    return cursor.lastrowid
+
+@metrics.timed_db
+async def get_all_aliases():
+    """Returns every alias as (id, user_id, alias) tuples."""
+    async with _read() as db:
+        async with db.execute('SELECT id, user_id, alias FROM user_aliases') as cursor:
+            return [(row['id'], row['user_id'], row['alias']) async for row in cursor]
 
+@metrics.timed_db
 async def add_information(discord_id: int, category: str, content: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('INSERT INTO information (user_id, category, content) VALUES (?, ?, ?)', 
-                         (discord_id, category, content))
-        await db.commit()
+    """
+    Stores a normalised fact unless the user already has the same fact in that category.
+    Returns True if a row was added.
+    """
+    return bool(await add_information_bulk(discord_id, [(category, content)]))
 
+@metrics.timed_db
+@_writes
+async def add_information_bulk(discord_id: int, facts):
+    """
+    Stores many (category, content) facts for a user in one transaction.
+    Facts the user already has (same category and normalised content) are
+    skipped via the unique content_hash index. Returns the (category, content)
+    pairs that were actually added.
+    """
+    rows = []
+    for category, content in facts:
+        content = clean_fact(content)
+        if content:
+            rows.append((category or DEFAULT_CATEGORY, content))
+    if not rows:
+        return []
+
+    added = []
+    async with _write() as db:
+        for category, content in rows:
+            cursor = await db.execute('''
+                INSERT INTO information (user_id, category, content, content_hash) VALUES (?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ''', (discord_id, category, content, fact_hash(content)))
+            if cursor.rowcount:
+                added.append((category, content))
+    if added:
+        profile_cache.invalidate(discord_id)
+        index = fact_indexes.get(discord_id)
+        if index is not None:
+            index.add(added)
+    return added
+
+@metrics.timed_db
+@_writes
 async def add_story(title: str, content: str, homeworld: str = None):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _write() as db:
         await db.execute('INSERT INTO stories (title, content, homeworld) VALUES (?, ?, ?)', (title, content, homeworld))
-        await db.commit()
 
+def format_profile_context(profile):
+    """Formats a profile as the [User Context] block used in the system prompt."""
+    aliases = ", ".join(profile.get('aliases', []))
+    info_text = ""
+    for cat, items in profile.get('information', {}).items():
+        info_text += f"{cat}: " + "; ".join(items) + ". "
+    return f"\n[User Context: This is {profile['name']}. Aliases: {aliases}. Known Info: {info_text}]"
+
+# Lookups checked by benchmarks/check_query_plans.py
+PROFILE_ALIASES_SQL = 'SELECT alias FROM user_aliases WHERE user_id = ?'
+PROFILE_INFORMATION_SQL = 'SELECT category, content FROM information WHERE user_id = ? ORDER BY id'
+
+@metrics.timed_db
 async def get_user_profile(discord_id: int):
     """
     Fetches all data related to a user: Basic info, Aliases, and recorded Information.
+    Also includes the extracted 'homeworld', the formatted prompt 'context' and
+    a 'fact_index' (facts.FactIndex) for ranking the facts by relevance.
+    Profiles are served from profile_cache; treat the returned dict as read-only.
     """
+    profile = profile_cache.get(discord_id)
+    if profile is not None:
+        return profile
+
+    version = profile_cache.version
     profile = {}
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
+    async with _read() as db:
         # Basic Info
         async with db.execute('SELECT * FROM users WHERE discord_id = ?', (discord_id,)) as cursor:
             user_row = await cursor.fetchone()
@@ -105,82 +506,266 @@ async def get_user_profile(discord_id: int):
             profile['id'] = user_row['discord_id']
 
         # Aliases
-        async with db.execute('SELECT alias FROM user_aliases WHERE user_id = ?', (discord_id,)) as cursor:
+        async with db.execute(PROFILE_ALIASES_SQL, (discord_id,)) as cursor:
             aliases = await cursor.fetchall()
             profile['aliases'] = [row['alias'] for row in aliases]
 
         # Information
-        async with db.execute('SELECT category, content FROM information WHERE user_id = ?', (discord_id,)) as cursor:
+        async with db.execute(PROFILE_INFORMATION_SQL, (discord_id,)) as cursor:
             info_rows = await cursor.fetchall()
             # Group by category
             info_data = {}
             for row in info_rows:
-                cat = row['category'] or 'General'
+                cat = row['category'] or DEFAULT_CATEGORY
                 if cat not in info_data:
                     info_data[cat] = []
                 info_data[cat].append(row['content'])
             profile['information'] = info_data
-            
+
+    homeworld = info_data.get('Homeworld')
+    profile['homeworld'] = homeworld[0] if homeworld else None
+    profile['context'] = format_profile_context(profile)
+    profile['fact_index'] = _fact_index(discord_id, info_rows)
+    profile_cache.set(discord_id, profile, version)
     return profile
 
+def _fact_index(discord_id: int, info_rows):
+    """Returns the cached FactIndex for a user, rebuilding it if it no longer matches their facts."""
+    version = fact_indexes.version
+    index = fact_indexes.get(discord_id)
+    facts = [(row['category'] or DEFAULT_CATEGORY, row['content']) for row in info_rows]
+    if index is not None and len(index) < len(facts) and index.facts == facts[:len(index)]:
+        # Only new facts since the index was built (e.g. written by another process)
+        index.add(facts[len(index):])
+    elif index is None or index.facts != facts:
+        index = FactIndex(facts)
+        fact_indexes.set(discord_id, index, version)
+    return index
+
+RECENT_STORIES_SQL = 'SELECT title, content, homeworld FROM stories ORDER BY created_at DESC LIMIT ?'
+HOMEWORLD_STORIES_SQL = 'SELECT title, content, homeworld FROM stories WHERE homeworld = ? ORDER BY created_at DESC LIMIT ?'
+GENERAL_STORIES_SQL = 'SELECT title, content, homeworld FROM stories WHERE homeworld IS NULL ORDER BY created_at DESC LIMIT ?'
+
+@metrics.timed_db
 async def get_recent_stories(limit=3, homeworld: str = None):
     """
     Fetches the most recent stories to provide general lore context.
     If homeworld is specified, prioritizes stories from that homeworld.
     """
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _read() as db:
         if homeworld:
-            # Get homeworld-specific stories first, then general stories
-            async with db.execute('''
-                SELECT title, content, homeworld FROM stories 
-                WHERE homeworld = ? OR homeworld IS NULL
-                ORDER BY 
-                    CASE WHEN homeworld = ? THEN 0 ELSE 1 END,
-                    created_at DESC 
-                LIMIT ?
-            ''', (homeworld, homeworld, limit)) as cursor:
+            # Homeworld-specific stories first, then general stories; two index
+            # range reads instead of one OR query that sorts every match
+            async with db.execute(HOMEWORLD_STORIES_SQL, (homeworld, limit)) as cursor:
                 rows = await cursor.fetchall()
+            if len(rows) < limit:
+                async with db.execute(GENERAL_STORIES_SQL, (limit - len(rows),)) as cursor:
+                    rows += await cursor.fetchall()
         else:
-            async with db.execute('SELECT title, content, homeworld FROM stories ORDER BY created_at DESC LIMIT ?', (limit,)) as cursor:
+            async with db.execute(RECENT_STORIES_SQL, (limit,)) as cursor:
                 rows = await cursor.fetchall()
         return [{'title': row['title'], 'content': row['content'], 'homeworld': row['homeworld']} for row in rows]
 
+def _fts_query(text: str, max_terms: int = 32):
+    """
+    Turns free text into an FTS5 query that ORs its words together.
+    Returns None if nothing searchable is left.
+    """
+    terms = []
+    for word in re.findall(r'\w+', text.casefold()):
+        # Skip short words and raw ids (e.g. from <@123> mentions)
+        if len(word) < 3 or word.isdigit() or word in terms:
+            continue
+        terms.append(word)
+        if len(terms) >= max_terms:
+            break
+    if not terms:
+        return None
+    return ' OR '.join(f'"{term}"' for term in terms)
+
+@metrics.timed_db
+async def search_stories(query: str, limit=3, homeworld: str = None, snippet_tokens: int = 32,
+                         only_homeworld: bool = False):
+    """
+    Ranks stories against `query` with BM25 (title weighted above content).
+    Stories from `homeworld` get a relevance boost, or with `only_homeworld`
+    are the only ones returned. Each result carries an FTS snippet centred on
+    the matches instead of the whole content.
+    """
+    match = _fts_query(query)
+    if match is None:
+        return []
+    homeworld_filter = 'AND s.homeworld = ?2' if only_homeworld and homeworld else ''
+    async with _read() as db:
+        async with db.execute(f'''
+            SELECT s.title, s.homeworld,
+                   snippet(stories_fts, 1, '', '', '...', ?1) AS snippet,
+                   bm25(stories_fts, 5.0, 1.0) * CASE WHEN s.homeworld = ?2 THEN 2.0 ELSE 1.0 END AS rank
+            FROM stories_fts
+            JOIN stories s ON s.id = stories_fts.rowid
+            WHERE stories_fts MATCH ?3 {homeworld_filter}
+            ORDER BY rank
+            LIMIT ?4
+        ''', (snippet_tokens, homeworld, match, limit)) as cursor:
+            rows = await cursor.fetchall()
+        return [{'title': row['title'], 'snippet': row['snippet'], 'homeworld': row['homeworld']} for row in rows]
+
+@metrics.timed_db
+async def get_meta(key: str):
+    async with _read() as db:
+        async with db.execute('SELECT value FROM meta WHERE key = ?', (key,)) as cursor:
+            row = await cursor.fetchone()
+            return row['value'] if row else None
+
+@metrics.timed_db
+@_writes
+async def set_meta(key: str, value: str):
+    async with _write() as db:
+        await db.execute('INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+
+# --- BULK IMPORT / EXPORT ---
+# Record kinds in the archive format, in the order they are exported
+ARCHIVE_KINDS = ('user', 'alias', 'information', 'story')
+
+_EXPORT_QUERIES = {
+    'user': 'SELECT discord_id, name, created_at FROM users ORDER BY discord_id',
+    'alias': 'SELECT user_id, alias FROM user_aliases ORDER BY id',
+    'information': 'SELECT user_id, category, content, created_at FROM information ORDER BY id',
+    'story': 'SELECT title, content, homeworld, created_at FROM stories ORDER BY id',
+}
+
+@metrics.timed_db
+async def iter_records(kind: str):
+    """
+    Yields every row of one archive kind as a dict, streaming from a cursor
+    so the table is never held in memory.
+    """
+    async with _read() as db:
+        async with db.execute(_EXPORT_QUERIES[kind]) as cursor:
+            async for row in cursor:
+                yield dict(row)
+
+@metrics.timed_db
+@_writes
+async def import_records(kind: str, records):
+    """
+    Writes a chunk of archive records of one kind in a single transaction.
+    Re-importing is safe: existing users are renamed, and aliases, facts and
+    stories that are already present are skipped. Returns the rows written.
+    """
+    if kind == 'user':
+        sql = '''
+            INSERT INTO users (discord_id, name, created_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT(discord_id) DO UPDATE SET name = excluded.name WHERE name != excluded.name
+        '''
+        rows = [(r['discord_id'], r['name'], r.get('created_at')) for r in records]
+    elif kind == 'alias':
+        sql = '''
+            INSERT INTO user_aliases (user_id, alias) SELECT ?1, ?2
+            WHERE NOT EXISTS (SELECT 1 FROM user_aliases WHERE user_id = ?1 AND alias = ?2)
+        '''
+        rows = [(r['user_id'], r['alias']) for r in records]
+    elif kind == 'information':
+        sql = '''
+            INSERT INTO information (user_id, category, content, content_hash, created_at)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT DO NOTHING
+        '''
+        rows = []
+        for r in records:
+            content = clean_fact(r['content'])
+            if content:
+                rows.append((r['user_id'], r.get('category') or DEFAULT_CATEGORY, content, fact_hash(content), r.get('created_at')))
+    elif kind == 'story':
+        sql = '''
+            INSERT INTO stories (title, content, homeworld, created_at) SELECT ?1, ?2, ?3, COALESCE(?4, CURRENT_TIMESTAMP)
+            WHERE ?4 IS NULL OR NOT EXISTS (SELECT 1 FROM stories WHERE created_at = ?4 AND title IS ?1)
+        '''
+        rows = [(r.get('title'), r['content'], r.get('homeworld'), r.get('created_at')) for r in records]
+    else:
+        raise ValueError(f"Unknown archive record type: {kind}")
+
+    if not rows:
+        return 0
+    async with _write() as db:
+        cursor = await db.executemany(sql, rows)
+        written = cursor.rowcount
+    if kind != 'story':
+        profile_cache.clear()
+        fact_indexes.clear()
+    return written
+
+def story_page_sql(by_homeworld: bool, keyset: str = None) -> str:
+    """The get_story_page() query; `keyset` is None, 'before' or 'after'."""
+    clauses = ['homeworld = ?'] if by_homeworld else []
+    if keyset == 'before':
+        clauses.append('(created_at, id) < (?, ?)')
+    elif keyset == 'after':
+        clauses.append('(created_at, id) > (?, ?)')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    direction = 'ASC' if keyset == 'after' else 'DESC'
+    return f'SELECT id, title, homeworld, created_at FROM stories {where} ORDER BY created_at {direction}, id {direction} LIMIT ?'
+
+@metrics.timed_db
+async def get_story_page(limit: int = 10, homeworld: str = None, before=None, after=None):
+    """
+    One page of story titles and metadata (id, title, homeworld, created_at),
+    newest first, using keyset pagination on (created_at, id).
+
+    Pass a story's (created_at, id) as `before` for the page of older stories
+    after it, or as `after` for the page of newer stories before it.
+    Returns (stories, more), where `more` says whether further stories exist
+    in the direction being paged.
+    """
+    params = [homeworld] if homeworld else []
+    if before is not None:
+        params.extend(before)
+    elif after is not None:
+        params.extend(after)
+    keyset = 'before' if before is not None else 'after' if after is not None else None
+    direction = 'ASC' if keyset == 'after' else 'DESC'
+
+    async with _read() as db:
+        async with db.execute(story_page_sql(bool(homeworld), keyset), (*params, limit + 1)) as cursor:
+            rows = await cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'ASC':
+        rows.reverse()
+    return [{'id': row['id'], 'title': row['title'], 'homeworld': row['homeworld'], 'created_at': row['created_at']} for row in rows], more
+
+@metrics.timed_db
 async def get_all_stories():
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _read() as db:
         async with db.execute('SELECT id, title, content, homeworld, created_at FROM stories ORDER BY created_at DESC') as cursor:
             rows = await cursor.fetchall()
             return [{'id': row['id'], 'title': row['title'], 'content': row['content'], 'homeworld': row['homeworld'], 'created_at': row['created_at']} for row in rows]
 
+@metrics.timed_db
 async def get_user_homeworld(discord_id: int):
-    """Get the homeworld of a user from their information."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute('SELECT content FROM information WHERE user_id = ? AND category = ?', (discord_id, 'Homeworld')) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+    """Get the homeworld of a user from their information (served from the profile cache)."""
+    profile = await get_user_profile(discord_id)
+    return profile['homeworld'] if profile else None
+
+NAME_EXACT_SQL = 'SELECT discord_id FROM users WHERE name_nocase = ?'
+ALIAS_EXACT_SQL = 'SELECT user_id FROM user_aliases WHERE alias_nocase = ? LIMIT 1'
 
+@metrics.timed_db
 async def search_user_by_name(search_term: str):
     """
     Search for a user by their name or alias.
     Returns the discord_id if found, None otherwise.
     """
     search_lower = search_term.lower()
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        # First, try to find by exact name match
-        async with db.execute('SELECT discord_id FROM users WHERE LOWER(name) = ?', (search_lower,)) as cursor:
+    async with _read() as db:
+        # First, try to find by exact name match (indexed, case-insensitive)
+        async with db.execute(NAME_EXACT_SQL, (search_lower,)) as cursor:
             row = await cursor.fetchone()
             if row:
                 return row['discord_id']
         
         # Then try to find by alias match
-        async with db.execute('''
-            SELECT user_id FROM user_aliases 
-            WHERE LOWER(alias) = ? 
-            LIMIT 1
-        ''', (search_lower,)) as cursor:
+        async with db.execute(ALIAS_EXACT_SQL, (search_lower,)) as cursor:
             row = await cursor.fetchone()
             if row:
                 return row['user_id']
@@ -188,7 +773,7 @@ async def search_user_by_name(search_term: str):
         # Try partial match on names and aliases
         async with db.execute('''
             SELECT discord_id FROM users 
-            WHERE LOWER(name) LIKE ?
+            WHERE name_nocase LIKE ?
             LIMIT 1
         ''', (f'%{search_lower}%',)) as cursor:
             row = await cursor.fetchone()
@@ -197,7 +782,7 @@ async def search_user_by_name(search_term: str):
         
         async with db.execute('''
             SELECT user_id FROM user_aliases 
-            WHERE LOWER(alias) LIKE ?
+            WHERE alias_nocase LIKE ?
             LIMIT 1
         ''', (f'%{search_lower}%',)) as cursor:
             row = await cursor.fetchone()
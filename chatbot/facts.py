@@ -0,0 +1,106 @@
+import hashlib
+import re
+import numpy as np
+
+# Words that don't change what a fact says ("User's real name is X" == "Real name is X")
+FILLER_WORDS = frozenset(['a', 'an', 'the', 'user', 'users', 's'])
+# Words too common in chat to say anything about which facts are relevant
+STOPWORDS = FILLER_WORDS | frozenset([
+    'i', 'me', 'my', 'you', 'your', 'he', 'she', 'it', 'we', 'they', 'them', 'their', 'his', 'her',
+    'is', 'are', 'was', 'were', 'be', 'been', 'am', 'do', 'does', 'did', 'have', 'has', 'had',
+    'and', 'or', 'but', 'of', 'to', 'in', 'on', 'at', 'for', 'with', 'from', 'by', 'about', 'as',
+    'this', 'that', 'what', 'who', 'which', 'how', 'any', 'know', 'tell', 'echo', 'so', 'not', 'can',
+])
+
+def clean_fact(content: str) -> str:
+    """Normalise a fact for storage: collapse whitespace, drop trailing punctuation."""
+    return re.sub(r'\s+', ' ', content).strip().rstrip('.;,!').strip()
+
+def fact_key(content: str) -> str:
+    """Comparison key for a fact. Facts with equal keys are duplicates."""
+    words = re.findall(r'\w+', content.casefold())
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
+def fact_hash(content: str) -> str:
+    """Short stable hash of a fact's comparison key, stored for duplicate suppression."""
+    return hashlib.blake2b(fact_key(content).encode(), digest_size=8).hexdigest()
+
+def terms(text: str):
+    """Lowercased words of `text` that can carry meaning, for relevance scoring."""
+    return [word for word in re.findall(r'\w+', text.casefold()) if word not in STOPWORDS]
+
+class FactIndex:
+    """
+    BM25 index over one user's (category, content) facts.
+
+    Postings are kept as parallel NumPy arrays (term, fact, term frequency),
+    so a query is scored with one mask and one bincount. Facts can be added
+    incrementally; anything else (deletions, reordering) needs a rebuild.
+    Facts are numbered in the order they were added, oldest first.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, facts=()):
+        self.facts = []
+        self._vocab = {}
+        self._df = np.zeros(0, dtype=np.int32)
+        self._term_ids = np.zeros(0, dtype=np.int32)
+        self._fact_ids = np.zeros(0, dtype=np.int32)
+        self._tf = np.zeros(0, dtype=np.float32)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self.add(facts)
+
+    def __len__(self):
+        return len(self.facts)
+
+    def add(self, facts):
+        facts = list(facts)
+        term_ids, fact_ids, tf, lengths = [], [], [], []
+        for category, content in facts:
+            counts = {}
+            for word in terms(f"{category} {content}"):
+                term_id = self._vocab.setdefault(word, len(self._vocab))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            fact_id = len(self.facts) + len(lengths)
+            term_ids.extend(counts)
+            fact_ids.extend([fact_id] * len(counts))
+            tf.extend(counts.values())
+            lengths.append(sum(counts.values()))
+        if not lengths:
+            return
+        self.facts.extend(facts)
+        new_terms = np.array(term_ids, dtype=np.int32)
+        self._term_ids = np.concatenate([self._term_ids, new_terms])
+        self._fact_ids = np.concatenate([self._fact_ids, np.array(fact_ids, dtype=np.int32)])
+        self._tf = np.concatenate([self._tf, np.array(tf, dtype=np.float32)])
+        self._lengths = np.concatenate([self._lengths, np.array(lengths, dtype=np.float32)])
+        self._df = np.concatenate([self._df, np.zeros(len(self._vocab) - len(self._df), dtype=np.int32)])
+        np.add.at(self._df, new_terms, 1)
+
+    def scores(self, text: str):
+        """BM25 score of every fact against `text`, as an array indexed like `facts`."""
+        query = np.array(sorted({self._vocab[word] for word in terms(text) if word in self._vocab}), dtype=np.int32)
+        if not len(query) or not self.facts:
+            return np.zeros(len(self.facts), dtype=np.float32)
+        mask = np.isin(self._term_ids, query)
+        term_ids, fact_ids, tf = self._term_ids[mask], self._fact_ids[mask], self._tf[mask]
+        n = len(self.facts)
+        df = self._df[term_ids]
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        norm = self.K1 * (1 - self.B + self.B * self._lengths[fact_ids] / max(self._lengths.mean(), 1.0))
+        weights = idf * tf * (self.K1 + 1) / (tf + norm)
+        return np.bincount(fact_ids, weights=weights, minlength=n).astype(np.float32)
+
+    def rank(self, query: str, context: str = '', context_weight: float = 0.5, limit: int = None):
+        """
+        Fact indices ordered by relevance to `query`, with `context` (e.g. recent
+        history) counting `context_weight` as much. Ties go to the newest fact.
+        """
+        scores = self.scores(query)
+        if context:
+            scores += context_weight * self.scores(context)
+        newest_first = np.arange(len(self.facts))[::-1]
+        order = newest_first[np.argsort(-scores[newest_first], kind='stable')]
+        return order[:limit].tolist() if limit is not None else order.tolist()
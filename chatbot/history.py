@@ -0,0 +1,155 @@
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger('LoreBot.History')
+
+# Rough per-entry overhead (object, slots, deque cell) used for the memory cap
+ENTRY_OVERHEAD = 120
+
+class HistoryEntry:
+    __slots__ = ('message_id', 'author_name', 'content')
+
+    def __init__(self, message_id: int, author_name: str, content: str):
+        self.message_id = message_id
+        self.author_name = author_name
+        self.content = content
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message.id, message.author.display_name, message.content)
+
+    @property
+    def size(self) -> int:
+        return ENTRY_OVERHEAD + len(self.author_name) + len(self.content)
+
+    def line(self) -> str:
+        return f"{self.author_name}: {self.content}"
+
+class _ChannelBuffer:
+    __slots__ = ('entries', 'warm', 'size')
+
+    def __init__(self, limit: int):
+        self.entries = deque(maxlen=limit)
+        # Warm once the buffer is known to hold the channel's latest messages
+        # without gaps: after an API backfill, or after `limit` live messages.
+        self.warm = False
+        self.size = 0
+
+class ChannelHistory:
+    """
+    Rolling per-channel message history, filled from gateway events.
+
+    Each channel keeps its last `limit` messages. When the total estimated size
+    passes `max_bytes`, the least recently used channels are dropped.
+    """
+
+    def __init__(self, limit: int = 20, max_bytes: int = 8 * 1024 * 1024):
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self._channels = OrderedDict()  # channel_id -> _ChannelBuffer
+        self._size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self):
+        return len(self._channels)
+
+    def _buffer(self, channel_id: int) -> _ChannelBuffer:
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            buffer = self._channels[channel_id] = _ChannelBuffer(self.limit)
+        else:
+            self._channels.move_to_end(channel_id)
+        return buffer
+
+    def _push(self, buffer: _ChannelBuffer, entry: HistoryEntry):
+        if len(buffer.entries) == buffer.entries.maxlen:
+            dropped = buffer.entries[0]
+            buffer.size -= dropped.size
+            self._size -= dropped.size
+            # A full window of live messages means nothing is missing
+            buffer.warm = True
+        buffer.entries.append(entry)
+        buffer.size += entry.size
+        self._size += entry.size
+
+    def _evict(self, keep: int):
+        while self._size > self.max_bytes and len(self._channels) > 1:
+            channel_id, buffer = next(iter(self._channels.items()))
+            if channel_id == keep:
+                break
+            del self._channels[channel_id]
+            self._size -= buffer.size
+            self.stats['evictions'] += 1
+
+    def append(self, message):
+        """Record a message delivered by the gateway."""
+        channel_id = message.channel.id
+        self._push(self._buffer(channel_id), HistoryEntry.from_message(message))
+        self._evict(keep=channel_id)
+
+    def edit(self, channel_id: int, message_id: int, content: str):
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            return
+        for entry in buffer.entries:
+            if entry.message_id == message_id:
+                delta = len(content) - len(entry.content)
+                entry.content = content
+                buffer.size += delta
+                self._size += delta
+                return
+
+    def delete(self, channel_id: int, message_id: int):
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            return
+        for entry in buffer.entries:
+            if entry.message_id == message_id:
+                buffer.entries.remove(entry)
+                buffer.size -= entry.size
+                self._size -= entry.size
+                return
+
+    def seed(self, channel_id: int, messages):
+        """
+        Backfill a channel from the API. `messages` must be oldest first.
+        Live messages that arrived during the fetch are kept after them.
+        """
+        buffer = self._buffer(channel_id)
+        entries = [HistoryEntry.from_message(m) for m in messages]
+        last_id = entries[-1].message_id if entries else 0
+        newer = [e for e in buffer.entries if e.message_id > last_id]
+
+        self._size -= buffer.size
+        buffer.entries.clear()
+        buffer.size = 0
+        for entry in entries + newer:
+            self._push(buffer, entry)
+        buffer.warm = True
+        self._evict(keep=channel_id)
+
+    def lines(self, channel_id: int):
+        """
+        Returns the channel's history as "author: content" lines, oldest first,
+        or None if the buffer is cold and should be backfilled from the API.
+        """
+        buffer = self._channels.get(channel_id)
+        if buffer is None or not buffer.warm:
+            self.stats['misses'] += 1
+            return None
+        self._channels.move_to_end(channel_id)
+        self.stats['hits'] += 1
+        return [entry.line() for entry in buffer.entries]
+
+    def mark_cold(self, channel_filter=None):
+        """
+        Mark channels as possibly missing messages (e.g. after a new gateway session):
+        every channel, or those whose id `channel_filter` returns True for.
+        """
+        for channel_id, buffer in self._channels.items():
+            if channel_filter is None or channel_filter(channel_id):
+                buffer.warm = False
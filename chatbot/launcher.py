@@ -0,0 +1,170 @@
+"""
+Runs the bot as several shard worker processes plus one writer service.
+
+Usage (from the chatbot directory):
+    python launcher.py                      # Discord's recommended shard count, one worker per core
+    python launcher.py --shards 8 --workers 4 --metrics-port 9100
+
+Starts writer.py, waits for its socket, then starts the workers one at a
+time. Each worker is a bot.py process that owns a contiguous range of shards,
+reads lore.db through its own read-only connections and sends its writes to
+the writer service. Any process that exits is restarted with backoff.
+SIGINT/SIGTERM stop the workers first and then the writer, so writes
+already queued are finished.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+import aiohttp
+from dotenv import load_dotenv
+from writer import DEFAULT_SOCKET
+
+logger = logging.getLogger('LoreBot.Launcher')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+IDENTIFY_INTERVAL = 5.0  # Seconds per shard identify (Discord allows one per 5s per bucket)
+WRITER_START_TIMEOUT = 60.0  # Seconds to wait for the writer's socket (migrations run first)
+RESTART_DELAY = 1.0  # Seconds before restarting a crashed process, doubled per crash
+RESTART_MAX_DELAY = 60.0
+STABLE_AFTER = 60.0  # A process that ran this long gets the short restart delay again
+STOP_TIMEOUT = 30.0  # Seconds to wait after SIGTERM before killing a process
+
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            return (await response.json())['shards']
+
+def shard_ranges(shard_count: int, workers: int):
+    """Split shard ids 0..shard_count-1 into at most `workers` contiguous ranges."""
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+async def wait_for_socket(path: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Writer service did not open {path} within {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+class Supervisor:
+    """Keeps named child processes running until stop()."""
+
+    def __init__(self):
+        self.stopping = False
+        self._processes = {}  # name -> Process
+        self._tasks = {}      # name -> supervising Task
+        self.stats = {'starts': 0, 'restarts': 0}
+
+    def start(self, name: str, argv, env):
+        self._tasks[name] = asyncio.create_task(self._supervise(name, argv, env))
+
+    async def _supervise(self, name, argv, env):
+        delay = RESTART_DELAY
+        while not self.stopping:
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(*argv, env=env, cwd=HERE)
+            self._processes[name] = process
+            self.stats['starts'] += 1
+            logger.info(f"Started {name} (pid {process.pid})")
+            status = await process.wait()
+            self._processes.pop(name, None)
+            if self.stopping:
+                break
+            if time.monotonic() - started > STABLE_AFTER:
+                delay = RESTART_DELAY
+            logger.warning(f"{name} exited with status {status}; restarting in {delay:.0f}s")
+            self.stats['restarts'] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+        logger.info(f"{name} stopped.")
+
+    async def stop(self, names):
+        """Terminate the named processes (killing any that outlive STOP_TIMEOUT) and stop restarting them."""
+        self.stopping = True
+        processes = [self._processes[name] for name in names if name in self._processes]
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in processes)), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    logger.warning(f"Killing pid {process.pid} after {STOP_TIMEOUT:.0f}s")
+                    process.kill()
+        tasks = [self._tasks.pop(name) for name in names if name in self._tasks]
+        for task in tasks:
+            # Interrupts a pending restart delay
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def main(args):
+    load_dotenv()
+    shard_count = args.shards or int(os.getenv('SHARD_COUNT', '0'))
+    if not shard_count:
+        shard_count = await recommended_shards(os.getenv('LORE_BOT_TOKEN'))
+    workers = args.workers or min(os.cpu_count() or 1, shard_count)
+    ranges = shard_ranges(shard_count, workers)
+    socket_path = os.path.join(HERE, args.socket)
+    logger.info(f"Launching {shard_count} shards across {len(ranges)} workers")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    supervisor = Supervisor()
+    supervisor.start('writer', [sys.executable, 'writer.py', '--socket', socket_path], dict(os.environ))
+    worker_names = []
+    try:
+        await wait_for_socket(socket_path, WRITER_START_TIMEOUT)
+        for i, shard_ids in enumerate(ranges):
+            if stop.is_set():
+                break
+            env = dict(os.environ,
+                       SHARD_COUNT=str(shard_count),
+                       SHARD_IDS=','.join(map(str, shard_ids)),
+                       LORE_WRITER_SOCKET=socket_path)
+            if args.metrics_port:
+                env['METRICS_PORT'] = str(args.metrics_port + i)
+            name = f"worker {i} (shards {shard_ids[0]}-{shard_ids[-1]})"
+            supervisor.start(name, [sys.executable, 'bot.py'], env)
+            worker_names.append(name)
+            # Let this worker identify its shards before the next one starts
+            if i < len(ranges) - 1:
+                try:
+                    await asyncio.wait_for(stop.wait(), IDENTIFY_INTERVAL * len(shard_ids))
+                except asyncio.TimeoutError:
+                    pass
+        await stop.wait()
+    finally:
+        logger.info("Shutting down workers...")
+        await supervisor.stop(worker_names)
+        await supervisor.stop(['writer'])
+        logger.info(f"Launcher stopped. Stats: {supervisor.stats}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, help='total shard count (default: SHARD_COUNT or what Discord recommends)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core, at most one per shard)')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'writer service socket (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--metrics-port', type=int, help='give worker N a metrics endpoint on this port + N')
+    asyncio.run(main(parser.parse_args()))
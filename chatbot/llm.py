@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+import groq
+import metrics
+
+logger = logging.getLogger('LoreBot.LLM')
+
+# Errors worth retrying: rate limits, server errors and transport failures
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.InternalServerError,
+    groq.APITimeoutError,
+    groq.APIConnectionError,
+)
+
+class LLMPipeline:
+    """
+    Runs chat completions off the event loop with a cap on in-flight requests.
+
+    Waiting requests are queued per channel and served round-robin, so one busy
+    channel cannot starve the others. Each request gets a timeout and is retried
+    with exponential backoff on 429/5xx and connection errors.
+    """
+
+    def __init__(self, client: groq.AsyncGroq, max_concurrency: int = 4, timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 20.0):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queues = OrderedDict()  # channel_id -> deque of (future, enqueued_at)
+        self._queued = 0
+        self._active = 0
+        self.stats = {
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'max_queue_depth': 0,
+            'last_wait': 0.0,
+            'max_wait': 0.0,
+            'total_wait': 0.0,
+            'waits': 0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._active
+
+    @property
+    def average_wait(self) -> float:
+        waits = self.stats['waits']
+        return self.stats['total_wait'] / waits if waits else 0.0
+
+    async def complete(self, channel_id: int, **kwargs):
+        """Queue a chat completion for `channel_id` and return the response."""
+        await self._acquire(channel_id)
+        try:
+            response = await self._call_with_retries(kwargs)
+            self.stats['completed'] += 1
+            self._record_usage(response.usage, kwargs, response.choices[0].message.content)
+            return response
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        finally:
+            self._release()
+
+    async def stream(self, channel_id: int, on_text, **kwargs) -> str:
+        """
+        Queue a streaming chat completion for `channel_id`.
+        `on_text` is awaited with each new piece of text; the full text is returned.
+        """
+        await self._acquire(channel_id)
+        try:
+            text = await self._stream_with_retries(on_text, kwargs)
+            self.stats['completed'] += 1
+            return text
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        finally:
+            self._release()
+
+    def _record_usage(self, usage, kwargs, text):
+        """Count tokens in/out, estimating from characters if the API sent no usage."""
+        if usage is not None:
+            tokens_in, tokens_out = usage.prompt_tokens, usage.completion_tokens
+        else:
+            tokens_in = sum(len(m.get('content') or '') for m in kwargs.get('messages', [])) // 4
+            tokens_out = len(text or '') // 4
+        metrics.LLM_TOKENS.inc(tokens_in, direction='in')
+        metrics.LLM_TOKENS.inc(tokens_out, direction='out')
+
+    async def _acquire(self, channel_id: int):
+        slot = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(channel_id, deque()).append((slot, time.monotonic()))
+        self._queued += 1
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queued)
+        self._dispatch()
+        try:
+            await slot
+        except asyncio.CancelledError:
+            # The slot may have been granted just before we were cancelled
+            if slot.done() and not slot.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to waiting requests, one channel at a time."""
+        while self._active < self.max_concurrency and self._queues:
+            channel_id, queue = next(iter(self._queues.items()))
+            slot, enqueued_at = queue.popleft()
+            if queue:
+                self._queues.move_to_end(channel_id)
+            else:
+                del self._queues[channel_id]
+            self._queued -= 1
+            if slot.cancelled():
+                continue
+
+            wait = time.monotonic() - enqueued_at
+            self.stats['last_wait'] = wait
+            self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+            self.stats['total_wait'] += wait
+            self.stats['waits'] += 1
+            if wait > 1.0:
+                logger.info(f"LLM request for channel {channel_id} waited {wait:.2f}s (queue depth {self._queued})")
+
+            self._active += 1
+            slot.set_result(None)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Honour Retry-After when the server sends one
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            try:
+                if retry_after is not None:
+                    return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _with_retries(self, call, can_retry=lambda: True):
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries or not can_retry():
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.stats['retries'] += 1
+                logger.warning(f"LLM request failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _call_with_retries(self, kwargs):
+        return await self._with_retries(
+            lambda: self.client.chat.completions.create(timeout=self.timeout, **kwargs)
+        )
+
+    async def _stream_with_retries(self, on_text, kwargs):
+        parts = []
+        usage = None
+
+        async def call():
+            nonlocal usage
+            stream = await self.client.chat.completions.create(stream=True, timeout=self.timeout, **kwargs)
+            async for chunk in stream:
+                # Groq reports usage on the final chunk (x_groq.usage)
+                x_groq = getattr(chunk, 'x_groq', None)
+                usage = chunk.usage or (x_groq.usage if x_groq is not None else None) or usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    await on_text(text)
+            return ''.join(parts)
+
+        # Once text has reached the user a retry would repeat it, so only retry before that
+        text = await self._with_retries(call, can_retry=lambda: not parts)
+        self._record_usage(usage, kwargs, text)
+        return text
@@ -0,0 +1,221 @@
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+logger = logging.getLogger('LoreBot.Metrics')
+
+# Per-mention trace, set while a mention is being handled
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_str(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class Counter:
+    """
+    Monotonic counter. If `trace_key` is set, increments are also added to the
+    current mention trace under that key (formatted with the labels).
+    """
+
+    def __init__(self, name: str, help_text: str, labels=(), trace_key: str = None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.trace_key = trace_key
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, value=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + value
+        trace = _current_trace.get()
+        if trace is not None and self.trace_key:
+            trace.count(self.trace_key.format(**labels), value)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for key, value in sorted(self._values.items()):
+            yield f'{self.name}{_label_str(self.labels, key)} {value}'
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for key, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{_label_str(self.labels, key, ("le", bound))} {bucket_count}'
+            yield f'{self.name}_bucket{_label_str(self.labels, key, ("le", "+Inf"))} {count}'
+            yield f'{self.name}_sum{_label_str(self.labels, key)} {total}'
+            yield f'{self.name}_count{_label_str(self.labels, key)} {count}'
+
+class Gauge:
+    """A value read from `fn` at scrape time."""
+
+    def __init__(self, name: str, help_text: str, fn):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        REGISTRY.append(self)
+
+    def collect(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        yield f'{self.name} {value}'
+
+REGISTRY = []
+
+# --- METRICS ---
+STAGE_SECONDS = Histogram('echo_stage_seconds', 'Time spent in each mention pipeline stage', ('stage',))
+MENTION_SECONDS = Histogram('echo_mention_seconds', 'Total time to handle a mention')
+MENTION_DB_QUERIES = Histogram('echo_mention_db_queries', 'Database queries per mention', buckets=(0, 1, 2, 4, 8, 16, 32, 64))
+DB_CALL_SECONDS = Histogram('echo_db_call_seconds', 'Latency of database.py functions', ('function',))
+DB_QUERIES = Counter('echo_db_queries_total', 'SQL statements run on pooled database connections', ('mode',), trace_key='db_queries')
+LLM_TOKENS = Counter('echo_llm_tokens_total', 'LLM tokens sent and received', ('direction',), trace_key='llm_tokens_{direction}')
+DISCORD_CALLS = Counter('echo_discord_api_calls_total', 'Discord REST API calls', ('call',), trace_key='discord_calls')
+MENTIONS = Counter('echo_mentions_total', 'Mentions handled')
+MEMORIES = Counter('echo_memories_total', 'Facts extracted from replies, by whether they were new', ('result',))
+
+def gauge(name: str, help_text: str, fn):
+    return Gauge(name, help_text, fn)
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+# --- TRACING ---
+
+class MentionTrace:
+    """Stage timings and counts collected while handling one mention."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total = None
+        self.stages = {}
+        self.counts = {}
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, key: str, value=1):
+        self.counts[key] = self.counts.get(key, 0) + value
+
+    def describe(self) -> str:
+        stages = ', '.join(f'{stage}={seconds * 1000:.0f}ms' for stage, seconds in self.stages.items())
+        counts = ', '.join(f'{key}={value}' for key, value in sorted(self.counts.items()))
+        return f'{stages} | {counts}'
+
+@contextmanager
+def trace():
+    """Collect a MentionTrace for everything run inside this block."""
+    mention_trace = MentionTrace()
+    token = _current_trace.set(mention_trace)
+    try:
+        yield mention_trace
+    finally:
+        _current_trace.reset(token)
+        mention_trace.total = time.perf_counter() - mention_trace.started_at
+        MENTIONS.inc()
+        MENTION_SECONDS.observe(mention_trace.total)
+        MENTION_DB_QUERIES.observe(mention_trace.counts.get('db_queries', 0))
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        mention_trace = _current_trace.get()
+        if mention_trace is not None:
+            mention_trace.add_stage(stage, elapsed)
+
+def timed_db(func):
+    """
+    Record the latency of a database.py coroutine function. For async
+    generators, only the time spent producing rows is recorded, not the time
+    the caller spends between them.
+    """
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                await generator.aclose()
+                DB_CALL_SECONDS.observe(elapsed, function=func.__name__)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - start, function=func.__name__)
+    return wrapper
+
+# --- HTTP ENDPOINT ---
+
+async def _handle_metrics(request):
+    return web.Response(body=render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_server(host: str = '127.0.0.1', port: int = 9100):
+    """Serve /metrics in Prometheus text format. Returns the runner for cleanup()."""
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
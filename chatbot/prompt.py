@@ -0,0 +1,189 @@
+import itertools
+import logging
+import math
+import database
+
+logger = logging.getLogger('LoreBot.Prompt')
+
+CHARS_PER_TOKEN = 4  # Rough average for English text; avoids shipping a tokenizer
+PRIORITY_CATEGORIES = ('Identity', 'Homeworld')  # Facts kept ahead of everything optional
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def format_story(story) -> str:
+    if 'snippet' in story:
+        content_snippet = story['snippet']
+    else:
+        content = story['content']
+        content_snippet = content[:200] + "..." if len(content) > 200 else content
+    homeworld_tag = f" [From {story['homeworld']}]" if story['homeworld'] else ""
+    return f"- Title: {story['title']}{homeworld_tag}\n  Snippet: {content_snippet}\n"
+
+class PromptAssembler:
+    """
+    Builds the chat messages for a mention within a token budget.
+
+    SYSTEM_PROMPT, the instructions and the message being answered are always
+    included. The rest is added by priority until the budget runs out:
+      1. Identity/Homeworld facts
+      2. The latest `min_history` lines of channel history
+      3. Stories, in relevance order
+      4. Other facts, most relevant to the message and recent history first,
+         at most `fact_limit` per user (None for no limit)
+      5. Older channel history, newest first
+    """
+
+    STORIES_HEADER = "\n[Relevant Lore/Stories in Database]\n"
+
+    def __init__(self, system_prompt: str, budget: int = 6000, min_history: int = 6, fact_limit: int = 20):
+        self.system_prompt = system_prompt
+        self.budget = budget
+        self.min_history = min_history
+        self.fact_limit = fact_limit
+
+    def build(self, profile, stories, history, author_name: str, content: str):
+        """
+        `profile` is a database profile dict (or None), `stories` a ranked list of
+        story dicts, `history` the channel history lines, oldest first, and
+        `content` the text of the message being answered, which facts are
+        ranked against. Returns the messages list for the chat completion.
+        """
+        instructions = (f"Please respond to the last message from {author_name}. "
+                        f"Remember to use [[MEMORY: Category | Content]] if you learn something new.")
+        return self._assemble([profile] if profile else [], stories, history, instructions, content)
+
+    def build_batch(self, askers, stories, history):
+        """
+        Like build(), for several mentions answered by one completion.
+        `askers` is a list of (author_name, message_content, profile) tuples.
+        The model is asked to answer each in its own [[REPLY n]] section.
+        """
+        lines = [f"Several people mentioned you at once. Reply to each of them separately, "
+                 f"starting each reply with its marker on its own line:"]
+        for number, (author_name, content, _) in enumerate(askers, start=1):
+            lines.append(f"[[REPLY {number}]] for {author_name}, who said: {content}")
+        lines.append("Put any [[MEMORY: Category | Content]] tag inside the reply for the person it is about. "
+                     "Remember to use [[MEMORY: Category | Content]] if you learn something new.")
+        profiles = []
+        for _, _, profile in askers:
+            if profile and all(profile['id'] != p['id'] for p in profiles):
+                profiles.append(profile)
+        query = "\n".join(content for _, content, _ in askers)
+        return self._assemble(profiles, stories, history, "\n".join(lines), query)
+
+    def _rank_facts(self, profiles, facts, query: str, context: str):
+        """
+        Non-priority facts to offer, most relevant first: up to `fact_limit` per
+        profile, interleaved so several askers share the budget fairly.
+        """
+        ranked = []
+        for p, profile in enumerate(profiles):
+            own = {(f[1], f[3]): f for f in facts if f[0] == p and f[1] not in PRIORITY_CATEGORIES}
+            index = profile.get('fact_index')
+            order = []
+            if index is not None:
+                for i in index.rank(query, context):
+                    fact = own.pop(index.facts[i], None)
+                    if fact is not None:
+                        order.append(fact)
+            # Anything the index doesn't cover goes last, newest first
+            order.extend(reversed(list(own.values())))
+            ranked.append(order[:self.fact_limit])
+        return [f for group in itertools.zip_longest(*ranked) for f in group if f is not None]
+
+    def _assemble(self, profiles, stories, history, instructions: str, query: str = ""):
+        remaining = self.budget - estimate_tokens(self.system_prompt) - estimate_tokens(
+            "Here is the recent conversation history:\n---\n\n---\n\n" + instructions)
+
+        # The latest message is required
+        history = history or []
+        kept_history = history[-1:]
+        remaining -= sum(estimate_tokens(line) + 1 for line in kept_history)
+
+        facts = []  # (profile index, category, index, content)
+        for p, profile in enumerate(profiles):
+            remaining -= estimate_tokens(database.format_profile_context(dict(profile, information={})))
+            for cat, items in profile.get('information', {}).items():
+                for i, content in enumerate(items):
+                    facts.append((p, cat, i, content))
+        priority_facts = [f for f in facts if f[1] in PRIORITY_CATEGORIES]
+        other_facts = self._rank_facts(profiles, facts, query, "\n".join(history[-self.min_history:]))
+
+        kept_facts = set()
+        kept_categories = set()
+
+        def take_fact(fact):
+            nonlocal remaining
+            p, cat, _, content = fact
+            cost = estimate_tokens(content + "; ")
+            if (p, cat) not in kept_categories:
+                cost += estimate_tokens(f"{cat}: . ")
+            if cost > remaining:
+                return
+            remaining -= cost
+            kept_facts.add(fact)
+            kept_categories.add((p, cat))
+
+        def take_history(lines):
+            # History stays contiguous: stop at the first line that doesn't fit
+            nonlocal remaining, kept_history
+            for line in reversed(lines):
+                cost = estimate_tokens(line) + 1
+                if cost > remaining:
+                    return False
+                remaining -= cost
+                kept_history.insert(0, line)
+            return True
+
+        for fact in priority_facts:
+            take_fact(fact)
+
+        older = history[:-1]
+        split = max(len(older) - (self.min_history - 1), 0)
+        recent, older = older[split:], older[:split]
+        history_complete = take_history(recent)
+
+        kept_stories = []
+        for story in stories or []:
+            cost = estimate_tokens(format_story(story))
+            if not kept_stories:
+                cost += estimate_tokens(self.STORIES_HEADER)
+            if cost > remaining:
+                continue
+            remaining -= cost
+            kept_stories.append(story)
+
+        for fact in other_facts:
+            take_fact(fact)
+
+        if history_complete:
+            take_history(older)
+
+        # Render, in the original section order
+        author_context = ""
+        for p, profile in enumerate(profiles):
+            profile_facts = [f for f in facts if f[0] == p]
+            if all(f in kept_facts for f in profile_facts):
+                author_context += profile.get('context') or database.format_profile_context(profile)
+            else:
+                information = {}
+                for fact in profile_facts:
+                    if fact in kept_facts:
+                        information.setdefault(fact[1], []).append(fact[3])
+                author_context += database.format_profile_context(dict(profile, information=information))
+
+        stories_context = ""
+        if kept_stories:
+            stories_context = self.STORIES_HEADER + "".join(format_story(s) for s in kept_stories)
+
+        dropped = (len(facts) - len(kept_facts), len(stories or []) - len(kept_stories), len(history) - len(kept_history))
+        if any(dropped):
+            logger.info(f"Prompt trimmed to fit {self.budget} tokens: dropped {dropped[0]} facts, "
+                        f"{dropped[1]} stories, {dropped[2]} history lines")
+
+        context_str = "\n".join(kept_history)
+        return [
+            {"role": "system", "content": self.system_prompt + author_context + stories_context},
+            {"role": "user", "content": f"Here is the recent conversation history:\n---\n{context_str}\n---\n\n{instructions}"}
+        ]
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import database
+
+logger = logging.getLogger('LoreBot.Registry')
+
+class UserRegistry:
+    """
+    In-memory map of known discord_id -> name, written behind to the database.
+
+    Repeat senders are answered from memory. New users and renames are queued
+    and flushed in one batched transaction every `flush_interval` seconds, or
+    sooner once `max_batch` entries are waiting.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_batch: int = 100):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.loaded = False
+        self._known = {}
+        self._pending = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'flushes': 0,
+            'flushed_users': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+        }
+
+    async def load(self):
+        """Populate the registry from the users table."""
+        self._known = await database.get_user_names()
+        self.loaded = True
+        logger.info(f"User registry loaded with {len(self._known)} users.")
+
+    def observe(self, discord_id: int, name: str) -> bool:
+        """
+        Record a sender. Only new users and renames are queued for writing.
+        Returns True if the user was new or renamed.
+        """
+        if self._known.get(discord_id) == name:
+            self.stats['hits'] += 1
+            return False
+        self.stats['misses'] += 1
+        self._known[discord_id] = name
+        self._pending[discord_id] = name
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+        return True
+
+    def is_pending(self, discord_id: int) -> bool:
+        return discord_id in self._pending
+
+    async def flush(self):
+        """Write every queued user in one transaction."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await database.upsert_users(list(batch.items()))
+            except Exception:
+                # Re-queue, without clobbering anything observed since
+                for discord_id, name in batch.items():
+                    self._pending.setdefault(discord_id, name)
+                raise
+            size = len(batch)
+            self.stats['flushes'] += 1
+            self.stats['flushed_users'] += size
+            self.stats['last_batch_size'] = size
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], size)
+            logger.debug(f"Flushed {size} users to the database.")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush user registry: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write out anything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"User registry stopped. Stats: {self.stats}")
@@ -0,0 +1,144 @@
+import logging
+import database
+
+logger = logging.getLogger('LoreBot.Resolver')
+
+def _trigrams(key: str):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+class _TermIndex:
+    """
+    Casefolded terms (names or aliases) indexed for exact and substring lookup.
+
+    Every term has a rank; when several terms match, the lowest rank wins.
+    Ranks mirror SQLite rowid order, so results match the old LIMIT 1 queries.
+    """
+
+    def __init__(self):
+        self._terms = {}     # rank -> (key, user_id)
+        self._exact = {}     # key -> set of ranks
+        self._grams = {}     # trigram -> set of ranks
+        self._short = {}     # memoised results for 1-2 character terms: key -> rank or None
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, rank: int, term: str, user_id: int):
+        if rank in self._terms:
+            self.remove(rank)
+        key = term.casefold()
+        self._terms[rank] = (key, user_id)
+        self._exact.setdefault(key, set()).add(rank)
+        for gram in _trigrams(key):
+            self._grams.setdefault(gram, set()).add(rank)
+        for short, best in self._short.items():
+            if short in key and (best is None or rank < best):
+                self._short[short] = rank
+
+    def remove(self, rank: int):
+        entry = self._terms.pop(rank, None)
+        if entry is None:
+            return
+        key = entry[0]
+        ranks = self._exact[key]
+        ranks.discard(rank)
+        if not ranks:
+            del self._exact[key]
+        for gram in _trigrams(key):
+            postings = self._grams[gram]
+            postings.discard(rank)
+            if not postings:
+                del self._grams[gram]
+        for short in [s for s, best in self._short.items() if best == rank]:
+            del self._short[short]
+
+    def exact(self, key: str):
+        ranks = self._exact.get(key)
+        return self._terms[min(ranks)][1] if ranks else None
+
+    def partial(self, key: str):
+        if len(key) < 3:
+            rank = self._short_rank(key)
+        else:
+            rank = self._substring_rank(key)
+        return self._terms[rank][1] if rank is not None else None
+
+    def _substring_rank(self, key: str):
+        postings = []
+        for gram in _trigrams(key):
+            ranks = self._grams.get(gram)
+            if not ranks:
+                return None
+            postings.append(ranks)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        matches = [rank for rank in candidates if key in self._terms[rank][0]]
+        return min(matches) if matches else None
+
+    def _short_rank(self, key: str):
+        # Too short for trigrams: scan once, then keep the answer current on add/remove
+        if key not in self._short:
+            matches = [rank for rank, (term, _) in self._terms.items() if key in term]
+            self._short[key] = min(matches) if matches else None
+        return self._short[key]
+
+class NameResolver:
+    """
+    In-memory replacement for database.search_user_by_name.
+
+    Lookups keep the same priority: exact name, exact alias, partial name,
+    partial alias. Names are ranked by discord_id and aliases by row id,
+    matching the order SQLite returned them in.
+    """
+
+    def __init__(self):
+        self._names = _TermIndex()
+        self._aliases = _TermIndex()
+        self._user_names = {}  # discord_id -> current name
+        self.loaded = False
+
+    async def load(self):
+        """Build the index from the users and user_aliases tables."""
+        names = await database.get_user_names()
+        aliases = await database.get_all_aliases()
+        self._names = _TermIndex()
+        self._aliases = _TermIndex()
+        self._user_names = {}
+        for discord_id, name in names.items():
+            self.set_name(discord_id, name)
+        for alias_id, user_id, alias in aliases:
+            self.add_alias(alias_id, user_id, alias)
+        self.loaded = True
+        logger.info(f"Name resolver loaded {len(self._names)} names and {len(self._aliases)} aliases.")
+
+    def set_name(self, discord_id: int, name: str):
+        """Add a user or apply a rename."""
+        if self._user_names.get(discord_id) == name:
+            return
+        self._user_names[discord_id] = name
+        self._names.add(discord_id, name, discord_id)
+
+    def add_alias(self, alias_id: int, discord_id: int, alias: str):
+        self._aliases.add(alias_id, alias, discord_id)
+
+    def resolve(self, term: str):
+        """Returns the discord_id for a name or alias, or None."""
+        key = term.casefold()
+        if not key:
+            return None
+        for lookup in (self._names.exact, self._aliases.exact, self._names.partial, self._aliases.partial):
+            found = lookup(key)
+            if found is not None:
+                return found
+        return None
+
+    def resolve_first(self, terms):
+        """
+        Resolve candidate terms in order and return (term, discord_id) for the
+        first one that matches, or (None, None).
+        """
+        for term in terms:
+            found = self.resolve(term)
+            if found is not None:
+                return term, found
+        return None, None
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+import metrics
+
+logger = logging.getLogger('LoreBot.Streaming')
+
+MESSAGE_LIMIT = 2000  # Discord's per-message character limit
+CHUNK_SIZE = 1900  # Chunk size used when a reply exceeds MESSAGE_LIMIT
+
+def split_reply(text: str):
+    """Split a reply into Discord-sized messages."""
+    if len(text) <= MESSAGE_LIMIT:
+        return [text]
+    return [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+
+class StreamingReply:
+    """
+    Shows a reply to `message` while it is still being generated.
+
+    The first message is posted once `min_first_chars` of visible text have
+    arrived, then edited in place at most every `edit_interval` seconds.
+    Text past the 2000 character limit rolls over into new messages, split the
+    same way as split_reply(). Anything matching `hidden_pattern` (and any
+    unfinished "[[" tag) is held back from display.
+
+    feed() only buffers text; Discord calls run in a background render task,
+    so slow or rate-limited edits never stall reading the completion stream.
+    """
+
+    def __init__(self, message, hidden_pattern, edit_interval: float = 1.2, min_first_chars: int = 40):
+        self.message = message
+        self.hidden_pattern = hidden_pattern
+        self.edit_interval = edit_interval
+        self.min_first_chars = min_first_chars
+        self.started_at = time.monotonic()
+        self.first_visible_at = None
+        self._buffer = ""
+        self._sent = []  # [discord.Message, content shown]
+        self._last_render = 0.0
+        self._dirty = False
+        self._rendering = False
+        self._task = None
+
+    @property
+    def time_to_first_visible(self):
+        if self.first_visible_at is None:
+            return None
+        return self.first_visible_at - self.started_at
+
+    def _visible(self) -> str:
+        text = self.hidden_pattern.sub('', self._buffer)
+        # Hold back a tag that may still be arriving
+        start = text.find('[[')
+        if start != -1:
+            text = text[:start]
+        elif text.endswith('['):
+            text = text[:-1]
+        return text.rstrip()
+
+    async def feed(self, text: str):
+        """Add newly generated text and schedule a refresh of the posted messages."""
+        self._buffer += text
+        self._dirty = True
+        if self._task is not None and not self._task.done():
+            return
+        if not self._sent and len(self._visible()) < self.min_first_chars:
+            return
+        self._task = asyncio.create_task(self._render_loop())
+
+    async def _render_loop(self):
+        # Renders the latest text, at most once per edit_interval, until caught up
+        while self._dirty:
+            wait = self._last_render + self.edit_interval - time.monotonic()
+            if self._sent and wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            self._rendering = True
+            try:
+                await self._render(self._visible())
+            except Exception as e:
+                # finish() renders the final text again, so a failed partial edit is not fatal
+                logger.warning(f"Failed to update streaming reply: {e}")
+                return
+            finally:
+                self._rendering = False
+
+    async def _stop_rendering(self):
+        if self._task is None:
+            return
+        if not self._rendering:
+            # Only waiting for its next edit slot
+            self._task.cancel()
+        try:
+            # An edit already under way is let through, so every posted message is known
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def finish(self, final_text: str):
+        """Show the final reply text (memory tags already removed)."""
+        await self._stop_rendering()
+        await self._render(final_text)
+        if self.time_to_first_visible is not None:
+            logger.info(f"Reply streamed: first visible text after {self.time_to_first_visible:.2f}s, "
+                        f"complete after {time.monotonic() - self.started_at:.2f}s")
+
+    async def abort(self):
+        """Stop rendering and delete the partial reply, e.g. when the completion failed."""
+        await self._stop_rendering()
+        for sent, _ in self._sent:
+            metrics.DISCORD_CALLS.inc(call='delete')
+            try:
+                await sent.delete()
+            except Exception as e:
+                logger.warning(f"Failed to delete partial streaming reply: {e}")
+        self._sent.clear()
+
+    async def _render(self, text: str):
+        if not text:
+            return
+        self._last_render = time.monotonic()
+        chunks = split_reply(text)
+        for i, chunk in enumerate(chunks):
+            if i < len(self._sent):
+                sent, shown = self._sent[i]
+                if shown != chunk:
+                    metrics.DISCORD_CALLS.inc(call='edit')
+                    await sent.edit(content=chunk)
+                    self._sent[i][1] = chunk
+            elif i == 0:
+                metrics.DISCORD_CALLS.inc(call='reply')
+                sent = await self.message.reply(chunk)
+                self.first_visible_at = time.monotonic()
+                self._sent.append([sent, chunk])
+            else:
+                metrics.DISCORD_CALLS.inc(call='send')
+                sent = await self.message.channel.send(chunk)
+                self._sent.append([sent, chunk])
+        # The final text can need fewer messages than a longer partial render did
+        for sent, _ in self._sent[len(chunks):]:
+            metrics.DISCORD_CALLS.inc(call='delete')
+            await sent.delete()
+        del self._sent[len(chunks):]
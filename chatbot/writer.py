@@ -0,0 +1,313 @@
+"""
+Writer service for sharded deployments.
+
+Usage (from the chatbot directory):
+    python writer.py [--socket lore-writer.sock] [--db lore.db]
+
+Owns the only writable connection to the lore database and runs migrations.
+Shard workers (bot.py with LORE_WRITER_SOCKET set, normally started by
+launcher.py) keep their own read-only connections and send every write here
+over a Unix socket. After each write the service tells every connected worker
+which cache entries to drop and what was written, so their profile caches
+and name resolvers stay current.
+
+Protocol, one JSON object per line:
+    worker -> service  {"id": 1, "op": "add_alias", "args": [...], "kwargs": {...}}
+    service -> worker  {"id": 1, "result": ...} or {"id": 1, "error": "ValueError", "message": "..."}
+    service -> worker  {"invalidate": "profile_cache", "key": 123}  (a null key clears the cache)
+    service -> worker  {"written": "add_alias", "alias_id": 7, "discord_id": 123, "alias": "..."}
+
+Write events carry only what workers need to update in-memory state (see
+write_event()), never the full arguments, so bulk imports aren't echoed.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import signal
+import database
+
+logger = logging.getLogger('LoreBot.Writer')
+
+DEFAULT_SOCKET = 'lore-writer.sock'
+MAX_LINE = 64 * 1024 * 1024  # Longest request or event line (archive import chunks can be large)
+SHARED_CACHES = ('profile_cache', 'fact_indexes')  # database.py caches kept in step across processes
+REMOTE_ERRORS = (ValueError, TypeError, KeyError)  # Re-raised as themselves in the worker
+RECONNECT_DELAY = 0.5  # Seconds before the first reconnect attempt, doubled per failure
+RECONNECT_MAX_DELAY = 10.0
+
+class WriterError(RuntimeError):
+    """A write failed in the writer service, or the service could not be reached."""
+
+def _encode(message) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + '\n').encode()
+
+def write_event(op: str, args, kwargs, result):
+    """The minimal event broadcast to workers after a successful write."""
+    params = inspect.signature(getattr(database, op)).bind(*args, **kwargs).arguments
+    event = {'written': op}
+    if op == 'upsert_user':
+        event['users'] = [[params['discord_id'], params['name']]]
+    elif op == 'upsert_users':
+        event['users'] = params['users']
+    elif op == 'add_alias':
+        event.update(alias_id=result, discord_id=params['discord_id'], alias=params['alias'])
+    elif op == 'import_records':
+        event.update(kind=params['kind'], count=result)
+    return event
+
+class WriterService:
+    """
+    Runs database.py write functions for connected workers, one task per
+    request. Writes still serialize on the database write lock.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        self._server = None
+        self._clients = set()
+        self.stats = {'requests': 0, 'errors': 0, 'connections': 0}
+
+    async def start(self):
+        for name in SHARED_CACHES:
+            getattr(database, name).on_invalidate = functools.partial(self._invalidated, name)
+        if os.path.exists(self.path):
+            # Left behind by a previous run that didn't shut down cleanly
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_client, path=self.path, limit=MAX_LINE)
+        logger.info(f"Writer service listening on {self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        for name in SHARED_CACHES:
+            getattr(database, name).on_invalidate = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        logger.info(f"Writer service stopped. Stats: {self.stats}")
+
+    def _broadcast(self, message):
+        line = _encode(message)
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+            else:
+                writer.write(line)
+
+    def _invalidated(self, cache_name: str, key):
+        self._broadcast({'invalidate': cache_name, 'key': key})
+
+    async def _handle_client(self, reader, writer):
+        self._clients.add(writer)
+        self.stats['connections'] += 1
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._run(writer, json.loads(line)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Dropping worker connection: {e}")
+        finally:
+            # Requests already received still complete; only their responses are lost
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _run(self, writer, request):
+        self.stats['requests'] += 1
+        op = request.get('op')
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        try:
+            if op not in database.WRITE_OPERATIONS:
+                raise ValueError(f"Unknown write operation: {op}")
+            result = await getattr(database, op)(*args, **kwargs)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Write {op} failed: {e}")
+            response = {'id': request.get('id'), 'error': type(e).__name__, 'message': str(e)}
+        else:
+            self._broadcast(write_event(op, args, kwargs, result))
+            response = {'id': request.get('id'), 'result': result}
+        if not writer.is_closing():
+            writer.write(_encode(response))
+
+class WriterClient:
+    """
+    A shard worker's connection to the writer service.
+
+    call() forwards one write and returns its result. Cache invalidations are
+    applied to database.py's caches as they arrive, before the response to
+    the write that caused them. Write events (see write_event()) are passed
+    to `on_write(event)` if set. If the service goes away, pending calls fail
+    and the client reconnects in the background; once back it clears the
+    shared caches, since invalidations may have been missed meanwhile.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self.on_write = None
+        self._reader = None
+        self._writer = None
+        self._connected = asyncio.Event()
+        self._pending = {}  # request id -> Future
+        self._next_id = 0
+        self._task = None
+        self._closing = False
+        self.stats = {'calls': 0, 'errors': 0, 'reconnects': 0}
+
+    async def connect(self):
+        """Connect, retrying for up to `timeout` seconds in case the service is still starting."""
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                await self._open()
+                break
+            except OSError:
+                if asyncio.get_running_loop().time() + delay > deadline:
+                    raise WriterError(f"Writer service not reachable at {self.path}") from None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        self._task = asyncio.create_task(self._run())
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+        self._connected.set()
+        logger.info(f"Connected to the writer service at {self.path}")
+
+    async def call(self, op: str, *args, **kwargs):
+        if not self._connected.is_set():
+            try:
+                await asyncio.wait_for(self._connected.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                raise WriterError("Writer service unavailable") from None
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.stats['calls'] += 1
+        try:
+            self._writer.write(_encode({'id': request_id, 'op': op, 'args': args, 'kwargs': kwargs}))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['errors'] += 1
+            raise WriterError(f"Write {op} timed out after {self.timeout}s") from None
+        except ConnectionError as e:
+            self.stats['errors'] += 1
+            raise WriterError(f"Lost connection to the writer service: {e}") from None
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _dispatch(self, message):
+        if 'id' in message:
+            future = self._pending.pop(message['id'], None)
+            if future is None or future.done():
+                return
+            if 'error' in message:
+                future.set_exception(self._remote_error(message['error'], message.get('message', '')))
+            else:
+                future.set_result(message.get('result'))
+        elif 'invalidate' in message:
+            if message['invalidate'] not in SHARED_CACHES:
+                return
+            cache = getattr(database, message['invalidate'])
+            if message['key'] is None:
+                cache.clear()
+            else:
+                cache.invalidate(message['key'])
+        elif 'written' in message and self.on_write is not None:
+            try:
+                self.on_write(message)
+            except Exception as e:
+                logger.error(f"Failed to apply remote write {message['written']}: {e}")
+
+    @staticmethod
+    def _remote_error(name: str, text: str):
+        for error_type in REMOTE_ERRORS:
+            if error_type.__name__ == name:
+                return error_type(text)
+        return WriterError(f"{name}: {text}")
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                while line := await self._reader.readline():
+                    self._dispatch(json.loads(line))
+            except (ConnectionError, ValueError) as e:
+                logger.error(f"Writer service connection failed: {e}")
+            self._connected.clear()
+            self._writer.close()
+            self._fail_pending(WriterError("Lost connection to the writer service"))
+            if self._closing:
+                return
+
+            logger.warning("Lost connection to the writer service, reconnecting...")
+            delay = RECONNECT_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await self._open()
+                    break
+                except OSError as e:
+                    logger.debug(f"Writer service not reachable yet: {e}")
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            self.stats['reconnects'] += 1
+            for name in SHARED_CACHES:
+                getattr(database, name).clear()
+
+    async def close(self):
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+        self._connected.clear()
+        self._fail_pending(WriterError("Writer client closed"))
+        logger.info(f"Writer client closed. Stats: {self.stats}")
+
+async def main(args):
+    if args.db:
+        database.DB_NAME = args.db
+    await database.init_db()
+    service = WriterService(args.socket)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await service.start()
+        await stop.wait()
+    finally:
+        await service.stop()
+        await database.close_db()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Unix socket to listen on (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--db', help=f'database file (default: {database.DB_NAME})')
+    asyncio.run(main(parser.parse_args()))